@@ -1,25 +1,65 @@
-from flask import Flask, jsonify, request, render_template, Response, stream_with_context, send_from_directory
+from flask import Flask, Request, jsonify, request, render_template, Response, stream_with_context, send_from_directory
 from flaskwebgui import FlaskUI
 import os
-import subprocess
 import sys
 import json
-import time
 from werkzeug.utils import secure_filename
 import tempfile
 import shutil
+import asyncio
+import codecs
+import locale
+import re
+import functools
+import socket
+import signal
 
-from config import DESKTOP_CONFIG, CORPORATE_CONFIG, get_base_path, is_executable
+from config import DESKTOP_CONFIG, CORPORATE_CONFIG, is_executable
+
+# orjson serializes SSE payloads several times faster than the stdlib encoder
+try:
+    import orjson
+
+    def dumps_json(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    dumps_json = json.dumps
 
 app = Flask(__name__)
 
-# Fix the path construction
-SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), 'scripts')
-TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
-OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'data', 'output')
-ALLOWED_EXTENSIONS = ["mp4", "m4a", "gif", "mov", "webm"]
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'data', 'input')
+# Fix the path construction; everything hangs off the app directory, resolved once
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(APP_DIR, 'scripts')
+TEMPLATES_DIR = os.path.join(APP_DIR, 'templates')
+OUTPUT_DIR = os.path.join(APP_DIR, 'data', 'output')
+ALLOWED_EXTENSIONS = frozenset({"mp4", "m4a", "gif", "mov", "webm"})
+UPLOAD_FOLDER = os.path.join(APP_DIR, 'data', 'input')
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+class UploadRequest(Request):
+    """
+    Request that spools file uploads straight into UPLOAD_FOLDER.
+
+    Werkzeug normally spools uploads to an anonymous temp file that then has to
+    be copied out; a named file lets save_upload() move it into place instead,
+    so each video is written to disk once.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spooled = tempfile.NamedTemporaryFile(dir=UPLOAD_FOLDER, prefix='upload_', suffix='.part', delete=False)
+        if not hasattr(self, '_spooled_paths'):
+            self._spooled_paths = []
+        self._spooled_paths.append(spooled.name)
+        return spooled
+
+    def close(self):
+        super().close()
+        # Drop any spooled upload that a handler didn't move into place
+        for path in getattr(self, '_spooled_paths', ()):
+            if os.path.exists(path):
+                os.remove(path)
+
+app.request_class = UploadRequest
 
 def configure_for_desktop():
     """Configure flask settings for desktop"""
@@ -29,18 +69,291 @@ def configure_for_desktop():
         app.config['TEMPLATES_AUTO_RELOAD'] = False
         
         # Ensure data directories exist in executable
-        base_path = get_base_path()
         global OUTPUT_DIR, UPLOAD_FOLDER
-        OUTPUT_DIR = os.path.join(os.path.expanduser('~'), 'PayetteToolbelt', 'output')
-        UPLOAD_FOLDER = os.path.join(os.path.expanduser('~'), 'PayetteToolbelt', 'input')
+        data_dir = os.path.join(os.path.expanduser('~'), 'PayetteToolbelt')
+        OUTPUT_DIR = os.path.join(data_dir, 'output')
+        UPLOAD_FOLDER = os.path.join(data_dir, 'input')
         
         os.makedirs(OUTPUT_DIR, exist_ok=True)
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
         
-        print(f"Desktop mode: Data in {os.path.expanduser('~')}/PayetteToolbelt/")
+        print(f"Desktop mode: Data in {data_dir}")
+
+@functools.lru_cache(maxsize=None)
+def available_scripts():
+    """Map script name -> path for every .py in SCRIPTS_DIR, listed once per run"""
+    if not os.path.isdir(SCRIPTS_DIR):
+        return {}
+    return {
+        name[:-3]: os.path.join(SCRIPTS_DIR, name)
+        for name in os.listdir(SCRIPTS_DIR) if name.endswith('.py')
+    }
+
+def find_free_port():
+    """Return the first port in CORPORATE_CONFIG['port_range'] that we can bind"""
+    start, end = CORPORATE_CONFIG['port_range']
+    for port in range(start, end + 1):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            try:
+                sock.bind(('127.0.0.1', port))
+            except OSError:
+                continue
+            return port
+    raise RuntimeError(f"No free port between {start} and {end}")
+
+def start_server(**server_kwargs):
+    """Serve the app with waitress, or Flask's dev server if waitress isn't installed"""
+    flask_app = server_kwargs['app']
+    port = server_kwargs['port']
+    try:
+        import waitress
+    except ImportError:
+        flask_app.run(host='127.0.0.1', port=port, threaded=True)
+        return
+    # Each open SSE stream holds a worker thread for as long as its script runs
+    waitress.serve(flask_app, host='127.0.0.1', port=port, threads=CORPORATE_CONFIG['server_threads'])
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1][1:].lower() in ALLOWED_EXTENSIONS
+
+# Per-line SSE frames only vary by message, so the JSON skeleton is prebuilt
+# and just the line itself goes through dumps_json
+_LINE_PREFIX = {
+    'stdout': 'data: {"type": "stdout", "message": ',
+    'stderr': 'data: {"type": "stderr", "message": ',
+}
+_SSE_SUFFIX = '}\n\n'
+
+# Lines the downloader scripts print, at the start of the line, for each saved image
+_SAVED_LOOKAROUND = "Saved equirectangular panorama:"
+_SAVED_STREETVIEW = "Saved streetview panorama:"
+
+# Upper bound on how much SSE output is held back to coalesce into one write
+SSE_BATCH_BYTES = 16 * 1024
+
+# Uploads are copied in large chunks to keep write() calls down on big videos
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+def save_upload(file, dest_path):
+    """Move an uploaded file to dest_path, copying only when it can't be moved"""
+    spooled_path = getattr(file.stream, 'name', None)
+    if isinstance(spooled_path, str) and os.path.isfile(spooled_path):
+        # Already on disk via UploadRequest; close it so Windows allows the rename
+        file.stream.close()
+        try:
+            os.replace(spooled_path, dest_path)
+        except OSError:
+            # dest_path is on another drive
+            shutil.move(spooled_path, dest_path)
+        return
+
+    with open(dest_path, 'wb', buffering=0) as dst:
+        shutil.copyfileobj(file.stream, dst, UPLOAD_CHUNK_SIZE)
+
+# Child output is decoded the same way text-mode Popen would decode it
+_PIPE_ENCODING = locale.getpreferredencoding(False)
+
+# Longest line the pipe readers will buffer; anything longer is dropped
+PIPE_LINE_LIMIT = 1024 * 1024
+
+# Bytes requested per pipe read. A read returns as soon as any output is available,
+# so this only caps how much arrives at once.
+PIPE_READ_SIZE = 64 * 1024
+
+# tqdm redraws with a bare '\r', so that ends a line as much as '\n' does
+_LINE_BREAK = re.compile(r'\r\n|\r|\n')
+
+# Lines buffered per script before its pipes stop being read. If the client falls
+# behind, the child then blocks on a full pipe instead of our memory growing.
+PIPE_QUEUE_LINES = 1024
+
+async def _pump(stream, tag, out_q):
+    """Forward lines from a child pipe onto out_q, then signal EOF with None"""
+    decoder = codecs.getincrementaldecoder(_PIPE_ENCODING)(errors='replace')
+    tail = ''
+    # The last read ended on '\r', so a '\n' starting the next one is the same break
+    skip_lf = False
+    # Part of an overlong line was dropped; skip the rest of it up to the next break
+    dropping = False
+    try:
+        while True:
+            # Not readline(): it only returns at '\n', which would hold back every
+            # '\r' progress redraw until the script prints a newline or exits
+            raw = await stream.read(PIPE_READ_SIZE)
+            text = decoder.decode(raw, final=not raw)
+            # An empty decode (half a multibyte character) leaves the pending '\r' pending
+            if text:
+                if skip_lf and text.startswith('\n'):
+                    text = text[1:]
+                skip_lf = text.endswith('\r')
+            *lines, tail = _LINE_BREAK.split(tail + text)
+            for line in lines:
+                if dropping:
+                    dropping = False
+                    continue
+                await out_q.put((tag, line + '\n'))
+            if len(tail) > PIPE_LINE_LIMIT:
+                tail = ''
+                dropping = True
+            if not raw:
+                break
+        if tail and not dropping:
+            await out_q.put((tag, tail))
+    except OSError:
+        # A broken pipe just ends this stream early
+        pass
+    # Not in a finally: once cancelled nobody is reading, and a full queue would block
+    await out_q.put((tag, None))
+
+# Python opens every fd non-inheritable, so on POSIX skipping close_fds' sweep over
+# the fd table is safe. Its own session lets us kill a script together with the
+# ffmpeg/tqdm children it starts. Windows already restricts handle inheritance.
+if os.name == 'posix':
+    SPAWN_KWARGS = {'close_fds': False, 'start_new_session': True}
+else:
+    SPAWN_KWARGS = {}
+
+def _kill(process):
+    """Kill a script started by _spawn, along with its process group on POSIX"""
+    if os.name == 'posix':
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+
+async def _spawn(argv):
+    """Start argv with piped output and one pump task per pipe"""
+    process = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=PIPE_LINE_LIMIT,
+        **SPAWN_KWARGS
+    )
+    out_q = asyncio.Queue(maxsize=PIPE_QUEUE_LINES)
+    pumps = [
+        asyncio.ensure_future(_pump(process.stdout, 'stdout', out_q)),
+        asyncio.ensure_future(_pump(process.stderr, 'stderr', out_q)),
+    ]
+    return process, out_q, pumps
+
+def iter_script_output(argv):
+    """
+    Run argv and yield ('stdout' | 'stderr', line) pairs as the child writes them.
+
+    The pipes are driven by a private asyncio loop that only runs while we wait
+    for the next line, so there are no reader threads and no sleep-polling.
+    ('idle', None) is yielded whenever everything read so far has been handed
+    out, which is the point to flush anything batched. The final item is
+    ('exit', returncode). Closing the generator early kills the child.
+    """
+    loop = asyncio.new_event_loop()
+    process = None
+    pumps = []
+    try:
+        process, out_q, pumps = loop.run_until_complete(_spawn(argv))
+        open_pipes = len(pumps)
+        while open_pipes:
+            if out_q.empty():
+                yield 'idle', None
+            tag, line = loop.run_until_complete(out_q.get())
+            if line is None:
+                open_pipes -= 1
+                continue
+            yield tag, line
+        yield 'exit', loop.run_until_complete(process.wait())
+    finally:
+        if process and process.returncode is None:
+            _kill(process)
+            loop.run_until_complete(process.wait())
+        for pump in pumps:
+            pump.cancel()
+        if pumps:
+            loop.run_until_complete(asyncio.gather(*pumps, return_exceptions=True))
+        loop.close()
+
+def sse_error(message, kind='error'):
+    """Response carrying a single SSE error event"""
+    return Response(f"data: {dumps_json({'type': kind, 'message': message})}\n\n", mimetype='text/event-stream')
+
+def batch_frames(frames, max_bytes=SSE_BATCH_BYTES):
+    """
+    Coalesce SSE frames into fewer, larger writes.
+
+    A None in frames flushes whatever is pending, so callers decide when the
+    client must see output now; otherwise frames are held until max_bytes.
+    """
+    batch = []
+    size = 0
+    for frame in frames:
+        if frame is not None:
+            batch.append(frame)
+            size += len(frame)
+            if size < max_bytes:
+                continue
+        if batch:
+            yield ''.join(batch)
+            batch.clear()
+            size = 0
+    if batch:
+        yield ''.join(batch)
+
+def stream_script(argv, saved_prefix=None, intro=(), remove_after=None):
+    """
+    SSE response that runs argv and streams its output as it is written.
+
+    intro lines are sent as stdout before the script starts. With saved_prefix,
+    stdout lines starting with it are sent as saved_image events and the saved
+    filenames are listed in script_end. remove_after is deleted once the stream
+    is done.
+    """
+    def generate():
+        saved_filenames = []
+        returncode = None
+
+        try:
+            for line in intro:
+                yield _LINE_PREFIX['stdout'] + dumps_json(line) + _SSE_SUFFIX
+
+            for stream, line in iter_script_output(argv):
+                if stream == 'idle':
+                    yield None
+                elif stream == 'exit':
+                    returncode = line
+                elif saved_prefix and stream == 'stdout' and line.startswith(saved_prefix):
+                    # Extract filename from the output
+                    saved_filename = os.path.basename(line[len(saved_prefix):].strip())
+                    saved_filenames.append(saved_filename)
+
+                    # Try to extract panorama ID from the filename
+                    pano_id = saved_filename.split('_')[0] if '_' in saved_filename else saved_filename.split('.')[0]
+
+                    yield f"data: {dumps_json({'type': 'saved_image', 'path': saved_filename, 'pano_id': pano_id})}\n\n"
+                    # Show new images right away rather than waiting on the batch
+                    yield None
+                    print(f"[SCRIPT-STDOUT] {line.strip()}")
+                else:
+                    yield _LINE_PREFIX[stream] + dumps_json(line) + _SSE_SUFFIX
+                    print(f"[SCRIPT-{stream.upper()}] {line.strip()}")
+
+            if returncode != 0:
+                yield f"data: {dumps_json({'type': 'script_end', 'status': 'failure', 'code': returncode})}\n\n"
+            elif saved_prefix:
+                yield f"data: {dumps_json({'type': 'script_end', 'status': 'success', 'image_paths': saved_filenames, 'total_images': len(saved_filenames)})}\n\n"
+            else:
+                yield f"data: {dumps_json({'type': 'script_end', 'status': 'success'})}\n\n"
+
+        except Exception as e:
+            yield f"data: {dumps_json({'type': 'app_error', 'message': str(e)})}\n\n"
+            print(f"[APPLICATION_ERROR] {str(e)}", file=sys.stderr)
+        finally:
+            # Clean up temporary file
+            if remove_after and os.path.exists(remove_after):
+                os.remove(remove_after)
+
+    return Response(stream_with_context(batch_frames(generate())), mimetype='text/event-stream')
 
 @app.route("/")
 def home():
@@ -52,150 +365,42 @@ def lookaround_page():
 
 @app.route("/list_dirs")
 def list_dirs():
-    root_path = os.path.abspath(os.path.dirname(__file__))
-    dir_contents = {}
-    for item in os.listdir(root_path):
-        full_path = os.path.join(root_path, item)
-        if os.path.isdir(full_path):
-            dir_contents[item] = "directory"
-        else:
-            dir_contents[item] = "file"
+    # scandir entries already know their type, so no extra stat per item
+    with os.scandir(APP_DIR) as entries:
+        dir_contents = {
+            entry.name: "directory" if entry.is_dir() else "file"
+            for entry in entries
+        }
     return jsonify(dir_contents)
 
+# Saved panoramas don't change once written, so browsers may keep them for a year
+PANORAMA_MAX_AGE = 365 * 24 * 60 * 60
+
 # Add route to serve static panorama images
 @app.route("/static/panoramas/<filename>")
 def serve_panorama(filename):
-    return send_from_directory(OUTPUT_DIR, filename)
+    response = send_from_directory(OUTPUT_DIR, filename, max_age=PANORAMA_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route("/stream_lookaround", methods=["GET"])
 def stream_lookaround_data():
-    lat = request.args.get("lat")
-    lon = request.args.get("lon")
-    num_panos = request.args.get("num_panos", "1")  # Default to 1 if not specified
-    zoom = request.args.get("zoom_lvl", "2")
-
-    if not lat or not lon:
-        def error_response():
-            yield f"data: {json.dumps({'type': 'error', 'message': 'Latitude and longitude are required query parameters.'})}\n\n"
-        return Response(error_response(), mimetype='text/event-stream')
-
-    try:
-        lat = float(lat)
-        lon = float(lon)
-        num_panos = int(num_panos)
-        zoom = int(zoom)
-        
-        # Validate num_panos range
-        if num_panos < 1 or num_panos > 500:
-            raise ValueError("Number of panoramas must be between 1 and 50")
-            
-    except (ValueError, TypeError) as e:
-        def error_response():
-            yield f"data: {json.dumps({'type': 'error', 'message': f'Invalid parameters: {str(e)}'})}\n\n"
-        return Response(error_response(), mimetype='text/event-stream')
-
-    script_name = "get_lookaround"
-    script_path = os.path.join(SCRIPTS_DIR, script_name + '.py')
-
-    if not os.path.exists(script_path):
-        def error_response():
-            error_msg = f"Script '{script_name}.py' not found in {SCRIPTS_DIR}."
-            yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
-        return Response(error_response(), mimetype='text/event-stream')
-
-    def generate():
-        process = None
-        saved_filenames = []
-
-        try:
-            # Pass the number of panoramas as the third argument
-            process = subprocess.Popen(
-                [sys.executable, script_path, str(lat), str(lon), str(num_panos)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=0
-            )
-
-            from threading import Thread
-            from queue import Queue, Empty
-
-            q_stdout = Queue()
-            q_stderr = Queue()
-
-            def enqueue_output(out, queue):
-                for line in iter(out.readline, ''):
-                    queue.put(line)
-                out.close()
-
-            t_stdout = Thread(target=enqueue_output, args=(process.stdout, q_stdout))
-            t_stderr = Thread(target=enqueue_output, args=(process.stderr, q_stderr))
-
-            t_stdout.daemon = True
-            t_stderr.daemon = True
-            t_stdout.start()
-            t_stderr.start()
-
-            while process.poll() is None or not q_stdout.empty() or not q_stderr.empty():
-                try:
-                    line = q_stdout.get_nowait()
-                    # Look for saved panorama output
-                    if "Saved equirectangular panorama:" in line:
-                        # Extract filename from the output
-                        saved_path = line.split("Saved equirectangular panorama:")[-1].strip()
-                        saved_filename = os.path.basename(saved_path)
-                        saved_filenames.append(saved_filename)
-                        
-                        # Try to extract panorama ID from the filename
-                        pano_id = saved_filename.split('_')[0] if '_' in saved_filename else saved_filename.split('.')[0]
-                        
-                        yield f"data: {json.dumps({'type': 'saved_image', 'path': saved_filename, 'pano_id': pano_id})}\n\n"
-                    else:
-                        yield f"data: {json.dumps({'type': 'stdout', 'message': line})}\n\n"
-                    print(f"[SCRIPT-STDOUT] {line.strip()}")
-                except Empty:
-                    pass
-
-                try:
-                    line = q_stderr.get_nowait()
-                    yield f"data: {json.dumps({'type': 'stderr', 'message': line})}\n\n"
-                    print(f"[SCRIPT-STDERR] {line.strip()}")
-                except Empty:
-                    pass
-
-                time.sleep(0.01)
-
-            process.wait()
-
-            if process.returncode == 0:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'success', 'image_paths': saved_filenames, 'total_images': len(saved_filenames)})}\n\n"
-            else:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'failure', 'code': process.returncode})}\n\n"
-
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'app_error', 'message': str(e)})}\n\n"
-            print(f"[APPLICATION_ERROR] {str(e)}", file=sys.stderr)
-            if process:
-                process.kill()
-        finally:
-            if 't_stdout' in locals() and t_stdout.is_alive():
-                t_stdout.join(timeout=1)
-            if 't_stderr' in locals() and t_stderr.is_alive():
-                t_stderr.join(timeout=1)
-
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    return stream_panorama_script("get_lookaround", _SAVED_LOOKAROUND)
 
 @app.route("/stream_streetview", methods=["GET"])
 def stream_streetview_data():
+    return stream_panorama_script("get_streetview", _SAVED_STREETVIEW)
+
+def stream_panorama_script(script_name, saved_prefix):
+    """Validate the lat/lon/num_panos query and stream a panorama downloader script"""
     lat = request.args.get("lat")
     lon = request.args.get("lon")
     num_panos = request.args.get("num_panos", "1")  # Default to 1 if not specified
     zoom = request.args.get("zoom_lvl", "2")
 
     if not lat or not lon:
-        def error_response():
-            yield f"data: {json.dumps({'type': 'error', 'message': 'Latitude and longitude are required query parameters.'})}\n\n"
-        return Response(error_response(), mimetype='text/event-stream')
+        return sse_error('Latitude and longitude are required query parameters.')
 
     try:
         lat = float(lat)
@@ -208,101 +413,18 @@ def stream_streetview_data():
             raise ValueError("Number of panoramas must be between 1 and 500")
             
     except (ValueError, TypeError) as e:
-        def error_response():
-            yield f"data: {json.dumps({'type': 'error', 'message': f'Invalid parameters: {str(e)}'})}\n\n"
-        return Response(error_response(), mimetype='text/event-stream')
+        return sse_error(f'Invalid parameters: {str(e)}')
 
-    script_name = "get_streetview"
-    script_path = os.path.join(SCRIPTS_DIR, script_name + '.py')
+    script_path = available_scripts().get(script_name)
 
-    if not os.path.exists(script_path):
-        def error_response():
-            error_msg = f"Script '{script_name}.py' not found in {SCRIPTS_DIR}."
-            yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
-        return Response(error_response(), mimetype='text/event-stream')
-
-    def generate():
-        process = None
-        saved_filenames = []
+    if script_path is None:
+        return sse_error(f"Script '{script_name}.py' not found in {SCRIPTS_DIR}.")
 
-        try:
-            # Pass the number of panoramas as the third argument
-            process = subprocess.Popen(
-                [sys.executable, script_path, str(lat), str(lon), str(num_panos)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=0
-            )
-
-            from threading import Thread
-            from queue import Queue, Empty
-
-            q_stdout = Queue()
-            q_stderr = Queue()
-
-            def enqueue_output(out, queue):
-                for line in iter(out.readline, ''):
-                    queue.put(line)
-                out.close()
-
-            t_stdout = Thread(target=enqueue_output, args=(process.stdout, q_stdout))
-            t_stderr = Thread(target=enqueue_output, args=(process.stderr, q_stderr))
-
-            t_stdout.daemon = True
-            t_stderr.daemon = True
-            t_stdout.start()
-            t_stderr.start()
-
-            while process.poll() is None or not q_stdout.empty() or not q_stderr.empty():
-                try:
-                    line = q_stdout.get_nowait()
-                    # Look for saved panorama output
-                    if "Saved streetview panorama:" in line:
-                        # Extract filename from the output
-                        saved_path = line.split("Saved streetview pano to ")[-1].strip()
-                        print(f"[stream_streetview_data] saved_path: {saved_path}")
-                        saved_filename = os.path.basename(saved_path)
-                        saved_filenames.append(saved_filename)
-                        
-                        # Try to extract panorama ID from the filename
-                        pano_id = saved_filename.split('_')[0] if '_' in saved_filename else saved_filename.split('.')[0]
-                        
-                        yield f"data: {json.dumps({'type': 'saved_image', 'path': saved_filename, 'pano_id': pano_id})}\n\n"
-                    else:
-                        yield f"data: {json.dumps({'type': 'stdout', 'message': line})}\n\n"
-                    print(f"[SCRIPT-STDOUT] {line.strip()}")
-                except Empty:
-                    pass
-
-                try:
-                    line = q_stderr.get_nowait()
-                    yield f"data: {json.dumps({'type': 'stderr', 'message': line})}\n\n"
-                    print(f"[SCRIPT-STDERR] {line.strip()}")
-                except Empty:
-                    pass
-
-                time.sleep(0.01)
-
-            process.wait()
-
-            if process.returncode == 0:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'success', 'image_paths': saved_filenames, 'total_images': len(saved_filenames)})}\n\n"
-            else:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'failure', 'code': process.returncode})}\n\n"
-
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'app_error', 'message': str(e)})}\n\n"
-            print(f"[APPLICATION_ERROR] {str(e)}", file=sys.stderr)
-            if process:
-                process.kill()
-        finally:
-            if 't_stdout' in locals() and t_stdout.is_alive():
-                t_stdout.join(timeout=1)
-            if 't_stderr' in locals() and t_stderr.is_alive():
-                t_stderr.join(timeout=1)
-
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # Pass the number of panoramas as the third argument
+    return stream_script(
+        [sys.executable, script_path, str(lat), str(lon), str(num_panos)],
+        saved_prefix=saved_prefix
+    )
 
 @app.route("/video_tools", methods=["GET", "POST"])
 def stream_converter():
@@ -311,221 +433,70 @@ def stream_converter():
 @app.route("/upload_video", methods=["POST"])
 def upload_video():
     if 'video' not in request.files:
-        return Response(
-            f"data: {json.dumps({'type': 'error', 'message': 'No video file provided'})}\n\n",
-            mimetype='text/event-stream'
-        )
+        return sse_error('No video file provided')
     
     file = request.files['video']
     if file.filename == '':
-        return Response(
-            f"data: {json.dumps({'type': 'error', 'message': 'No file selected'})}\n\n",
-            mimetype='text/event-stream'
-        )
+        return sse_error('No file selected')
     
     if not allowed_file(file.filename):
-        return Response(
-            f"data: {json.dumps({'type': 'error', 'message': 'Invalid file type. Allowed: mp4, avi, mov, mkv, wmv, flv, webm'})}\n\n",
-            mimetype='text/event-stream'
-        )
+        return sse_error('Invalid file type. Allowed: mp4, avi, mov, mkv, wmv, flv, webm')
 
-    def generate():
-        temp_file_path = None
-        process = None
-        
-        try:
-            # Save uploaded file temporarily
-            filename = secure_filename(file.filename)
-            temp_file_path = os.path.join(OUTPUT_DIR, filename)
-            file.save(temp_file_path)
-            newline = '\n'
-            
-            yield f"data: {json.dumps({'type': 'stdout', 'message': f'File uploaded: {filename}{newline}'})}\n\n"
-            
-            script_path = os.path.join(SCRIPTS_DIR, 'get_video_frames.py')
-            
-            if not os.path.exists(script_path):
-                yield f"data: {json.dumps({'type': 'error', 'message': 'get_video_frames.py script not found'})}\n\n"
-                return
-            
-            # Execute the script
-            process = subprocess.Popen(
-                [sys.executable, script_path, temp_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=0
-            )
-            
-            from threading import Thread
-            from queue import Queue, Empty
-            
-            q_stdout = Queue()
-            q_stderr = Queue()
-            
-            def enqueue_output(out, queue):
-                for line in iter(out.readline, ''):
-                    queue.put(line)
-                out.close()
-            
-            t_stdout = Thread(target=enqueue_output, args=(process.stdout, q_stdout))
-            t_stderr = Thread(target=enqueue_output, args=(process.stderr, q_stderr))
-            
-            t_stdout.daemon = True
-            t_stderr.daemon = True
-            t_stdout.start()
-            t_stderr.start()
-            
-            while process.poll() is None or not q_stdout.empty() or not q_stderr.empty():
-                try:
-                    line = q_stdout.get_nowait()
-                    yield f"data: {json.dumps({'type': 'stdout', 'message': line})}\n\n"
-                except Empty:
-                    pass
-                
-                try:
-                    line = q_stderr.get_nowait()
-                    yield f"data: {json.dumps({'type': 'stderr', 'message': line})}\n\n"
-                except Empty:
-                    pass
-                
-                time.sleep(0.01)
-            
-            process.wait()
-            
-            if process.returncode == 0:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'success'})}\n\n"
-            else:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'failure', 'code': process.returncode})}\n\n"
-                
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'app_error', 'message': str(e)})}\n\n"
-            if process:
-                process.kill()
-        finally:
-            # Clean up temporary file
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-            if 't_stdout' in locals() and t_stdout.is_alive():
-                t_stdout.join(timeout=1)
-            if 't_stderr' in locals() and t_stderr.is_alive():
-                t_stderr.join(timeout=1)
-    
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    script_path = available_scripts().get('get_video_frames')
+    if script_path is None:
+        return sse_error('get_video_frames.py script not found')
+
+    # Save uploaded file temporarily. This has to happen before streaming starts,
+    # since the request's file stream is closed by the time the script runs.
+    filename = secure_filename(file.filename)
+    temp_file_path = os.path.join(OUTPUT_DIR, filename)
+    try:
+        save_upload(file, temp_file_path)
+    except OSError as e:
+        return sse_error(str(e), kind='app_error')
+
+    return stream_script(
+        [sys.executable, script_path, temp_file_path],
+        intro=[f'File uploaded: {filename}\n'],
+        remove_after=temp_file_path
+    )
 
 @app.route("/process_video", methods=["POST"])
 def process_video():
     if 'video' not in request.files:
-        return Response(
-            f"data: {json.dumps({'type': 'error', 'message': 'No video file provided'})}\n\n",
-            mimetype='text/event-stream'
-        )
+        return sse_error('No video file provided')
     
     if 'script' not in request.form:
-        return Response(
-            f"data: {json.dumps({'type': 'error', 'message': 'No script specified'})}\n\n",
-            mimetype='text/event-stream'
-        )
+        return sse_error('No script specified')
     
     file = request.files['video']
     script_name = request.form['script']
     
     if file.filename == '':
-        return Response(
-            f"data: {json.dumps({'type': 'error', 'message': 'No file selected'})}\n\n",
-            mimetype='text/event-stream'
-        )
+        return sse_error('No file selected')
     
     if not allowed_file(file.filename):
-        return Response(
-            f"data: {json.dumps({'type': 'error', 'message': 'Invalid file type. Allowed: mp4, avi, mov, mkv, wmv, flv, webm'})}\n\n",
-            mimetype='text/event-stream'
-        )
+        return sse_error('Invalid file type. Allowed: mp4, avi, mov, mkv, wmv, flv, webm')
 
-    def generate():
-        temp_file_path = None
-        process = None
-        
-        try:
-            # Save uploaded file temporarily
-            filename = secure_filename(file.filename)
-            temp_file_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(temp_file_path)
-            newline = '\n'
-            
-            yield f"data: {json.dumps({'type': 'stdout', 'message': f'File uploaded: {filename}{newline}'})}\n\n"
-            yield f"data: {json.dumps({'type': 'stdout', 'message': f'Running script: {script_name}{newline}'})}\n\n"
-            
-            script_path = os.path.join(SCRIPTS_DIR, script_name + '.py')
-            
-            if not os.path.exists(script_path):
-                yield f"data: {json.dumps({'type': 'error', 'message': f'{script_name}.py script not found'})}\n\n"
-                return
-            
-            # Execute the script with the video file path
-            process = subprocess.Popen(
-                [sys.executable, script_path, temp_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=0
-            )
-            
-            from threading import Thread
-            from queue import Queue, Empty
-            
-            q_stdout = Queue()
-            q_stderr = Queue()
-            
-            def enqueue_output(out, queue):
-                for line in iter(out.readline, ''):
-                    queue.put(line)
-                out.close()
-            
-            t_stdout = Thread(target=enqueue_output, args=(process.stdout, q_stdout))
-            t_stderr = Thread(target=enqueue_output, args=(process.stderr, q_stderr))
-            
-            t_stdout.daemon = True
-            t_stderr.daemon = True
-            t_stdout.start()
-            t_stderr.start()
-            
-            while process.poll() is None or not q_stdout.empty() or not q_stderr.empty():
-                try:
-                    line = q_stdout.get_nowait()
-                    yield f"data: {json.dumps({'type': 'stdout', 'message': line})}\n\n"
-                except Empty:
-                    pass
-                
-                try:
-                    line = q_stderr.get_nowait()
-                    yield f"data: {json.dumps({'type': 'stderr', 'message': line})}\n\n"
-                except Empty:
-                    pass
-                
-                time.sleep(0.01)
-            
-            process.wait()
-            
-            if process.returncode == 0:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'success'})}\n\n"
-            else:
-                yield f"data: {json.dumps({'type': 'script_end', 'status': 'failure', 'code': process.returncode})}\n\n"
-                
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'app_error', 'message': str(e)})}\n\n"
-            if process:
-                process.kill()
-        finally:
-            # Clean up temporary file
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-            if 't_stdout' in locals() and t_stdout.is_alive():
-                t_stdout.join(timeout=1)
-            if 't_stderr' in locals() and t_stderr.is_alive():
-                t_stderr.join(timeout=1)
-    
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    script_path = available_scripts().get(script_name)
+    if script_path is None:
+        return sse_error(f'{script_name}.py script not found')
+
+    # Save uploaded file temporarily. This has to happen before streaming starts,
+    # since the request's file stream is closed by the time the script runs.
+    filename = secure_filename(file.filename)
+    temp_file_path = os.path.join(UPLOAD_FOLDER, filename)
+    try:
+        save_upload(file, temp_file_path)
+    except OSError as e:
+        return sse_error(str(e), kind='app_error')
+
+    # Execute the script with the video file path
+    return stream_script(
+        [sys.executable, script_path, temp_file_path],
+        intro=[f'File uploaded: {filename}\n', f'Running script: {script_name}\n'],
+        remove_after=temp_file_path
+    )
 
 if __name__ == "__main__":
     # Configure for desktop mode
@@ -546,7 +517,8 @@ if __name__ == "__main__":
 
     ui = FlaskUI(
         app=app,
-        server="flask",
+        server=start_server,
+        server_kwargs={'app': app, 'port': find_free_port()},
         **DESKTOP_CONFIG,
     )
     
@@ -18,7 +18,6 @@ a = Analysis(
         'flaskwebgui',
         'pillow_heif',
         'streetlevel',
-        'py360convert',
         'cv2',
         'numpy',
         'tqdm',
@@ -25,4 +25,5 @@ CORPORATE_CONFIG = {
     'disable_dev_tools': True,  # Disable browser dev tools in production
     'auto_start_browser': False,  # Let FlaskWebGUI handle the window
     'port_range': (8000, 8100),  # Port range for finding available ports
+    'server_threads': 32,  # waitress worker threads; each open SSE stream holds one
 }
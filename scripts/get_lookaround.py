@@ -1,8 +1,10 @@
 import pillow_heif as ph
-from PIL import Image
 from streetlevel import lookaround
 import numpy as np
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import itertools
 import math 
 import sys
 import os
@@ -60,17 +62,22 @@ for dx in range(-search_radius, search_radius + 1):
     for dy in range(-search_radius, search_radius + 1):
         tile_coords_to_check.add((initial_tile_x + dx, initial_tile_y + dy))
 
-all_panos = []
 print(f"Fetching panoramas from {len(tile_coords_to_check)} coverage tiles (search radius: {search_radius})...")
 
-for tile_x, tile_y in tqdm(tile_coords_to_check, desc="Fetching tiles", file=sys.stderr):
+def safe_get_tile(coords):
+    """Panos on one coverage tile, or an empty list if the fetch fails"""
+    tile_x, tile_y = coords
     try:
         tile = lookaround.get_coverage_tile(tile_x, tile_y)
-        if tile and tile.panos:
-            all_panos.extend(tile.panos)
+        return tile.panos if tile and tile.panos else []
     except Exception as e:
         print(f"Could not fetch tile ({tile_x}, {tile_y}): {e}", file=sys.stderr)
-        continue
+        return []
+
+# Coverage tiles are independent requests; fetch them concurrently
+with ThreadPoolExecutor(max_workers=16) as ex:
+    results = list(tqdm(ex.map(safe_get_tile, tile_coords_to_check), total=len(tile_coords_to_check), desc="Fetching tiles", file=sys.stderr))
+all_panos = list(itertools.chain.from_iterable(results))
 
 if not all_panos:
     print("No panoramas found in the selected coverage tiles.", file=sys.stderr)
@@ -82,49 +89,80 @@ def distance(lat1, lon1, lat2, lon2):
     """Calculate simple Euclidean distance between two coordinates"""
     return math.sqrt(((lat1 - lat2) ** 2) + ((lon1 - lon2) ** 2))
 
-# Sort panoramas by distance and take the closest ones
-sorted_panos = sorted(all_panos, key=lambda p: distance(p.lat, p.lon, target_lat, target_lon))
-selected_panos = sorted_panos[:num_panos]
+# Take the closest panoramas without sorting the whole list.
+# Squared distance orders the same as distance, so the sqrt is skipped here.
+lats = np.fromiter((p.lat for p in all_panos), dtype=np.float64, count=len(all_panos))
+lons = np.fromiter((p.lon for p in all_panos), dtype=np.float64, count=len(all_panos))
+dist_sq = (lats - target_lat) ** 2 + (lons - target_lon) ** 2
+k = min(num_panos, len(all_panos))
+closest = np.argpartition(dist_sq, k - 1)[:k]
+closest = closest[np.argsort(dist_sq[closest])]
+selected_panos = [all_panos[i] for i in closest]
 
 print(f"\nSelected {len(selected_panos)} closest panorama(s):")
 for i, pano in enumerate(selected_panos, 1):
     dist = distance(pano.lat, pano.lon, target_lat, target_lon)
     print(f"  {i}. Pano {pano.id} at {pano.lat}, {pano.lon} (distance: {dist:.8f}) - {pano.date}")
 
-# Process each selected panorama
-successful_downloads = 0
-failed_downloads = 0
+# Process the selected panoramas concurrently. Downloads are network-bound and the
+# reprojection runs in torch, which releases the GIL, so threads are enough here;
+# a process pool would re-run this whole module in every worker on Windows.
+PANO_WORKERS = 4
+
+print_lock = threading.Lock()
+
+def log(*args, **kwargs):
+    """Print whole lines from worker threads without interleaving"""
+    with print_lock:
+        print(*args, flush=True, **kwargs)
+
+def process_pano(pano_idx, pano):
+    """Download, reproject and save one panorama; returns the saved path or None"""
+    log(f"Processing panorama {pano_idx}/{len(selected_panos)}: {pano.id}")
+
+    # The six faces are independent requests, so fetch them concurrently
+    try:
+        with ThreadPoolExecutor(max_workers=6) as ex:
+            face_heics = list(ex.map(lambda face_idx: lookaround.get_panorama_face(pano, face_idx, zoom, auth), range(0, 6)))
+    except Exception as e:
+        log(f"Error downloading faces for pano {pano.id}: {e}", file=sys.stderr)
+        log(f"Could not download all 6 faces for pano {pano.id}. Skipping equirectangular conversion.", file=sys.stderr)
+        return None
 
-for pano_idx, pano in enumerate(selected_panos, 1):
-    print(f"\nProcessing panorama {pano_idx}/{len(selected_panos)}: {pano.id}")
-    
+    # Each open_heif decodes in its own libheif context with the GIL released, so the
+    # panorama workers decode their faces in parallel
     faces = []
-    face_download_success = True
-    
-    for face_idx in tqdm(range(0, 6), desc=f"Downloading pano {pano_idx} faces", file=sys.stderr):
+    for face_idx, face_heic in enumerate(face_heics):
         try:
-            face_heic = lookaround.get_panorama_face(pano, face_idx, zoom, auth)
+            # to_equirectangular wants PIL images, so build one straight from the decoded
+            # buffer (honouring its row stride) rather than going through a numpy array
             face = ph.open_heif(face_heic, convert_hdr_to_8bit=False, bgr_mode=False)
-            np_arr = np.asarray(face)
-            faces.append(Image.fromarray(np_arr))
+            faces.append(face.to_pillow())
         except Exception as e:
-            print(f"Error downloading or processing face {face_idx} for pano {pano.id}: {e}", file=sys.stderr)
-            face_download_success = False
-            break
+            log(f"Error processing face {face_idx} for pano {pano.id}: {e}", file=sys.stderr)
+            return None
 
-    if face_download_success and len(faces) == 6:
-        try:
-            result = lookaround.to_equirectangular(faces, pano.camera_metadata)
-            output_filename = os.path.join(out_dir, f"{pano.id}_{zoom}.jpg")
-            result.save(output_filename, options={"quality": 100})
-            print(f"Saved equirectangular panorama: {output_filename}")
+    try:
+        result = lookaround.to_equirectangular(faces, pano.camera_metadata)
+        output_filename = os.path.join(out_dir, f"{pano.id}_{zoom}.jpg")
+        result.save(output_filename, quality=95, subsampling=2, optimize=False, progressive=False)
+        return output_filename
+    except Exception as e:
+        log(f"Error creating or saving equirectangular panorama for pano {pano.id}: {e}", file=sys.stderr)
+        return None
+
+successful_downloads = 0
+failed_downloads = 0
+
+with ThreadPoolExecutor(max_workers=min(PANO_WORKERS, len(selected_panos))) as ex:
+    futures = [ex.submit(process_pano, pano_idx, pano) for pano_idx, pano in enumerate(selected_panos, 1)]
+    for future in tqdm(as_completed(futures), total=len(futures), desc="Processing panoramas", file=sys.stderr):
+        output_filename = future.result()
+        if output_filename:
+            log(f"Saved equirectangular panorama: {output_filename}")
             successful_downloads += 1
-        except Exception as e:
-            print(f"Error creating or saving equirectangular panorama for pano {pano.id}: {e}", file=sys.stderr)
+        else:
             failed_downloads += 1
-    else:
-        print(f"Could not download all 6 faces for pano {pano.id}. Skipping equirectangular conversion.", file=sys.stderr)
-        failed_downloads += 1
 
 # Summary
 print(f"\n=== Processing Complete ===")
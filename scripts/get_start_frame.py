@@ -2,6 +2,12 @@ import sys
 import os
 import subprocess
 
+# PyAV decodes in-process, skipping the ffmpeg spawn; the ffmpeg CLI is the fallback
+try:
+    import av
+except ImportError:
+    av = None
+
 if len(sys.argv) < 2:
     print("Usage: python get_start_frame.py path/to/your/video/file.mp4")
     sys.exit()
@@ -31,10 +37,44 @@ output_path = os.path.join(output_dir, out_name)
 print(f"Extracting first frame of: {video_file}")
 print(f"Output directory: {output_dir}")
 
-cmd = ["ffmpeg", "-i", video_file, "-vf", "select=eq(n\,0)", "-vframes", "1", output_path]
+if av is not None:
+    try:
+        with av.open(video_file) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            frame = next(container.decode(stream))
+            # Phone videos are stored sideways with a display matrix; ffmpeg applies it
+            # automatically, so do the same. Older PyAV can't read it: leave those to ffmpeg.
+            rotation = getattr(frame, "rotation", None)
+            if rotation is None:
+                raise RuntimeError("this PyAV version doesn't expose the frame rotation")
+            image = frame.to_image()
+            if rotation:
+                image = image.rotate(rotation, expand=True)
+            image.save(output_path, quality=95)
+        print("Frame extraction completed successfully!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"PyAV could not extract the frame ({e}), falling back to ffmpeg")
+
+# Platform hardware decoder. Frames are downloaded back to system memory for the
+# JPEG encoder, so no -hwaccel_output_format is set.
+if sys.platform == "darwin":
+    hwaccel = ["-hwaccel", "videotoolbox"]
+elif sys.platform == "win32":
+    hwaccel = ["-hwaccel", "d3d11va"]
+else:
+    hwaccel = ["-hwaccel", "auto"]
+
+def ffmpeg_cmd(decode_args=()):
+    # Input-side seek to 0 emits the first frame without running every frame through a select filter
+    return ["ffmpeg", "-y", *decode_args, "-ss", "0", "-i", video_file, "-frames:v", "1", "-update", "1", "-q:v", "2", output_path]
 
 try:
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    result = subprocess.run(ffmpeg_cmd(hwaccel), capture_output=True, text=True)
+    if result.returncode != 0:
+        print("Hardware decoding failed, retrying in software")
+        result = subprocess.run(ffmpeg_cmd(), capture_output=True, text=True)
     print(f"Subprocess result: {result.stderr}")
     
     if result.returncode == 0:
@@ -3,6 +3,8 @@ from PIL import Image
 from streetlevel import streetview
 import numpy as np
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 import math 
 import sys
 import os
@@ -60,36 +62,62 @@ def distance(lat1, lon1, lat2, lon2):
     """Calculate simple Euclidean distance between two coordinates"""
     return math.sqrt(((lat1 - lat2) ** 2) + ((lon1 - lon2) ** 2))
 
-# Sort panoramas by distance and take the closest ones
-sorted_panos = sorted(all_panos, key=lambda p: distance(p.lat, p.lon, target_lat, target_lon))
-selected_panos = sorted_panos[:num_panos]
+# Take the closest panoramas without sorting the whole list.
+# Squared distance orders the same as distance, so the sqrt is skipped here.
+lats = np.fromiter((p.lat for p in all_panos), dtype=np.float64, count=len(all_panos))
+lons = np.fromiter((p.lon for p in all_panos), dtype=np.float64, count=len(all_panos))
+dist_sq = (lats - target_lat) ** 2 + (lons - target_lon) ** 2
+k = min(num_panos, len(all_panos))
+closest = np.argpartition(dist_sq, k - 1)[:k]
+closest = closest[np.argsort(dist_sq[closest])]
+selected_panos = [all_panos[i] for i in closest]
 
 print(f"\nSelected {len(selected_panos)} closest panorama(s):")
 for i, pano in enumerate(selected_panos, 1):
     dist = distance(pano.lat, pano.lon, target_lat, target_lon)
     print(f"  {i}. Pano {pano.id} at {pano.lat}, {pano.lon} (distance: {dist:.8f}) - {pano.date}")
 
-# Process each selected panorama
-successful_downloads = 0
-failed_downloads = 0
+# Process the selected panoramas concurrently. Each one is a batch of tile
+# downloads plus a stitch in PIL, so threads overlap the network waits without
+# a process pool re-running this whole module per worker on Windows.
+PANO_WORKERS = 4
+
+print_lock = threading.Lock()
 
-for pano_idx, pano in tqdm(enumerate(selected_panos, 1)):
-    print(f"\nProcessing panorama {pano_idx}/{len(selected_panos)}: {pano.id}")
+def log(*args, **kwargs):
+    """Print whole lines from worker threads without interleaving"""
+    with print_lock:
+        print(*args, flush=True, **kwargs)
 
-    panos = []
+def process_pano(pano_idx, pano):
+    """Download and save one panorama; returns the saved path or None"""
+    log(f"Processing panorama {pano_idx}/{len(selected_panos)}: {pano.id}")
     try:
         result = streetview.find_panorama_by_id(pano.id)
-        if result:
-            print(f"Successfully got pano: {result.id}")
-            img = streetview.get_panorama(result)
-            panos.append(result)
-            out_file = os.path.join(out_dir, f"google_{pano.id}_{zoom}.jpg")
-            img.save(out_file, options = {"quality":100})
-            print(f"Saved streetview panorama: {out_file}")
-            successful_downloads += 1
+        if not result:
+            log(f"Failed to get pano at {pano.lat}, {pano.lon}: not found")
+            return None
+        log(f"Successfully got pano: {result.id}")
+        img = streetview.get_panorama(result)
+        out_file = os.path.join(out_dir, f"google_{pano.id}_{zoom}.jpg")
+        img.save(out_file, quality=95, subsampling=2, optimize=False, progressive=False)
+        return out_file
     except Exception as e:
-        print(f"Failed to get pano at {pano.lat}, {pano.lon}: {e}")
-        failed_downloads += 1
+        log(f"Failed to get pano at {pano.lat}, {pano.lon}: {e}")
+        return None
+
+successful_downloads = 0
+failed_downloads = 0
+
+with ThreadPoolExecutor(max_workers=min(PANO_WORKERS, len(selected_panos))) as ex:
+    futures = [ex.submit(process_pano, pano_idx, pano) for pano_idx, pano in enumerate(selected_panos, 1)]
+    for future in tqdm(as_completed(futures), total=len(futures), desc="Processing panoramas", file=sys.stderr):
+        out_file = future.result()
+        if out_file:
+            log(f"Saved streetview panorama: {out_file}")
+            successful_downloads += 1
+        else:
+            failed_downloads += 1
 
 # Summary
 print(f"\n=== Processing Complete ===")
@@ -1,6 +1,12 @@
 #import webview
 import os
+import tempfile
 import requests
+import numpy as np
+import cv2
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageChops, ImageFile
 from tqdm import tqdm
 import io
@@ -8,6 +14,36 @@ import io
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 Image.MAX_IMAGE_PIXELS = None
 
+# Concurrent tile requests; roughly a browser's per-host connection limit
+TILE_WORKERS = 8
+TILE_TIMEOUT = 10
+
+# Tiles for a pano don't change, so keep them for a month in an optional on-disk
+# cache; re-running the same panoid then skips the network entirely
+TILE_CACHE_SECONDS = 30 * 24 * 60 * 60
+
+# In the per-user cache dir, so every launch directory shares one cache, and it stays
+# out of the repo and the PyInstaller bundle (which ships data/ wholesale)
+TILE_CACHE_DIR = os.path.join(
+    os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'PayetteToolbelt', 'tile_cache'
+)
+
+# One pooled session so every tile reuses a kept-alive connection
+try:
+    import requests_cache
+    os.makedirs(TILE_CACHE_DIR, exist_ok=True)
+    session = requests_cache.CachedSession(
+        os.path.join(TILE_CACHE_DIR, "tile_cache"), backend="sqlite", expire_after=TILE_CACHE_SECONDS
+    )
+except ImportError:
+    session = requests.Session()
+session.mount("https://", HTTPAdapter(
+    pool_connections=TILE_WORKERS,
+    pool_maxsize=TILE_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+))
+
 class API:
     def foo():
         print("Bar")
@@ -21,45 +57,42 @@ def get_tile_grid_size(zoom):
     y_tiles = (2 ** (zoom-1))
     return x_tiles, y_tiles
 
-def get_all_tiles(panoid, zoom=3, save_dir=None):
-    if save_dir is None:
-        save_dir = f"tiles_{panoid}_z{zoom}"
-    os.makedirs(save_dir, exist_ok=True)
-
+def get_all_tiles(panoid, zoom=3):
+    """Download every tile of a pano; returns ({(x, y): jpeg bytes}, x_tiles, y_tiles)"""
     x_tiles, y_tiles = get_tile_grid_size(zoom)
     print(f"Attempting to download {x_tiles} x {y_tiles} tiles for pano {panoid} at zoom {zoom}...")
 
-    tile_count = 0
-    for y in tqdm(range(y_tiles), desc="Downloading rows"):
-        for x in range(x_tiles):
-            url = (
-                f"https://streetviewpixels-pa.googleapis.com/v1/tile"
-                f"?cb_client=maps_sv.tactile&panoid={panoid}"
-                f"&x={x}&y={y}&zoom={zoom}&nbt=1&fover=2"
-            )
-            path = f"{save_dir}/tile_{x}_{y}.jpg"
-            #try:
-            r = requests.get(url, stream=True)
-            try:
-                r.raise_for_status()
-            except Exception as e:
-                pass
-            # A more robust check for valid image content
-            if len(r.content) > 1: 
-                with open(path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                tile_count += 1
+    def fetch_tile(coords):
+        x, y = coords
+        url = (
+            f"https://streetviewpixels-pa.googleapis.com/v1/tile"
+            f"?cb_client=maps_sv.tactile&panoid={panoid}"
+            f"&x={x}&y={y}&zoom={zoom}&nbt=1&fover=2"
+        )
+        try:
+            r = session.get(url, timeout=TILE_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"❌ Failed to download tile {x},{y}: {e}")
+            return None
+        # A more robust check for valid image content
+        return r.content if len(r.content) > 1 else None
+
+    # Tiles stay in memory; stitching happens in this process so there's no need to touch disk
+    tasks = [(x, y) for y in range(y_tiles) for x in range(x_tiles)]
+    with ThreadPoolExecutor(max_workers=TILE_WORKERS) as ex:
+        results = list(tqdm(ex.map(fetch_tile, tasks), total=len(tasks), desc="Downloading tiles"))
+    tiles = {coords: data for coords, data in zip(tasks, results) if data is not None}
+    tile_count = len(tiles)
 
     if tile_count == 0:
         print("⚠️ No valid tiles found or downloaded.")
     else:
         print(f"✅ Downloaded {tile_count} tiles.")
-    return save_dir, x_tiles, y_tiles
+    return tiles, x_tiles, y_tiles
 
 # -----------------------------------------------------------------------------
 
-def stitch_tiles(save_dir, panoid, x_tiles, y_tiles, output_file=None, zoom=5):
+def stitch_tiles(tiles, panoid, x_tiles, y_tiles, output_file=None, zoom=5):
     if output_file is None:
         output_file = f"{panoid}_stitched_z{zoom}.jpg"
 
@@ -69,43 +102,47 @@ def stitch_tiles(save_dir, panoid, x_tiles, y_tiles, output_file=None, zoom=5):
 
     print(f"Using a standard tile size of {STANDARD_TILE_W}x{STANDARD_TILE_H} for stitching.")
 
-    tile_matrix = [[None for _ in range(x_tiles)] for _ in range(y_tiles)]
-    loaded_tile_count = 0
-
-    # Load tiles and resize them to the standard size if necessary
-    for y in range(y_tiles):
-        for x in range(x_tiles):
-            path = f"{save_dir}/tile_{x}_{y}.jpg"
-            if os.path.exists(path):
-                try:
-                    tile = Image.open(path)
-                    # Resize tile if its dimensions do not match the standard dimensions
-                    if tile.size != (STANDARD_TILE_W, STANDARD_TILE_H):
-                        print(f"Resizing tile {x},{y} from {tile.size} to {STANDARD_TILE_W}x{STANDARD_TILE_H}")
-                        tile = tile.resize((STANDARD_TILE_W, STANDARD_TILE_H), Image.LANCZOS)
-                    tile_matrix[y][x] = tile
+    def load_tile(coords):
+        x, y = coords
+        data = tiles.get((x, y))
+        if data is None:
+            return None
+        tile = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if tile is None:
+            print(f"❌ Failed to open or process tile {x},{y}")
+            return None
+        # Resize tile if its dimensions do not match the standard dimensions
+        if tile.shape[:2] != (STANDARD_TILE_H, STANDARD_TILE_W):
+            print(f"Resizing tile {x},{y} from {tile.shape[1]}x{tile.shape[0]} to {STANDARD_TILE_W}x{STANDARD_TILE_H}")
+            tile = cv2.resize(tile, (STANDARD_TILE_W, STANDARD_TILE_H), interpolation=cv2.INTER_LANCZOS4)
+        return tile
+
+    # Decode every tile straight into one canvas; missing tiles stay black. The canvas is a
+    # file-backed memmap (384 MiB at zoom 5) so the OS can page it out instead of holding it all resident.
+    # cv2 releases the GIL while decoding, so threads spread the JPEG work across cores.
+    fd, canvas_path = tempfile.mkstemp(prefix=f"{panoid}_canvas_", suffix=".raw")
+    os.close(fd)
+    try:
+        canvas = np.memmap(canvas_path, dtype=np.uint8, mode="w+", shape=(STANDARD_TILE_H * y_tiles, STANDARD_TILE_W * x_tiles, 3))
+        loaded_tile_count = 0
+
+        coords = [(x, y) for y in range(y_tiles) for x in range(x_tiles)]
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for (x, y), tile in zip(coords, ex.map(load_tile, coords)):
+                if tile is not None:
+                    canvas[y * STANDARD_TILE_H:(y + 1) * STANDARD_TILE_H, x * STANDARD_TILE_W:(x + 1) * STANDARD_TILE_W] = tile
                     loaded_tile_count += 1
-                except Exception as e:
-                    print(f"❌ Failed to open or process tile {path}: {e}")
-            #else:
-            #    print(f"⚠️ Tile file not found (or was skipped during download): {path}. This spot will be black.")
 
-    if loaded_tile_count == 0:
-        print("No successfully loaded tiles found after processing — aborting stitching. Final image will be black.")
-        return
-
-    # Create a new blank image for the stitched panorama
-    output_img = Image.new("RGB", (STANDARD_TILE_W * x_tiles, STANDARD_TILE_H * y_tiles), (0, 0, 0))
+        if loaded_tile_count == 0:
+            print("No successfully loaded tiles found after processing — aborting stitching. Final image will be black.")
+            return
 
-    # Paste the processed tiles onto the output image
-    for y in range(y_tiles):
-        for x in range(x_tiles):
-            tile = tile_matrix[y][x]
-            if tile: # Only paste if the tile was successfully loaded and processed
-                output_img.paste(tile, (x * STANDARD_TILE_W, y * STANDARD_TILE_H))
-            # If tile is None, that area remains black as initialized, which is desired for missing tiles.
+        cv2.imwrite(output_file, canvas)
+    finally:
+        # Drop the mapping before deleting; Windows refuses to remove a mapped file
+        canvas = None
+        os.remove(canvas_path)
 
-    output_img.save(output_file)
     print(f"✅ Saved stitched image: {output_file}")
     return output_file
 
@@ -121,11 +158,6 @@ def crop_image(img_path):
         width, height = img.size
         print(f"Image dimensions for cropping: {width}x{height} pixels.")
 
-        # Get all pixel data once. This is faster than `getpixel` for iterative access.
-        # However, it means the entire image pixel data is loaded into a list,
-        # which can still be very memory intensive for *extremely* large images.
-        pixels = list(img.getdata()) 
-
         left_crop = (width - height) // 2
         right_crop = left_crop + height
         top_crop = 0
@@ -168,8 +200,8 @@ def main():
     panoids = [get_panoid(url) for url in urls]
     final_img = None
     for panoid in panoids:
-        a, b, c = get_all_tiles(panoid, zoom=5)
-        final_img = stitch_tiles(a, panoid, b, c, zoom=5)
+        tiles, b, c = get_all_tiles(panoid, zoom=5)
+        final_img = stitch_tiles(tiles, panoid, b, c, zoom=5)
 
     final_img = crop_image(final_img)
 
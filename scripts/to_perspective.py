@@ -1,85 +1,233 @@
-from concurrent.futures import ThreadPoolExecutor as tpe
-import py360convert
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import cv2
 import os
 import sys
-from PIL import Image
-
-def generate_and_save(e_img, file_name, out_dir, fov, pitch, yaw):
-    print(f"Creating pano with pitch {pitch} and yaw {yaw}")
-    perspective_img = py360convert.e2p(
-        e_img,
-        fov_deg=(fov, fov),
-        u_deg=yaw,
-        v_deg=pitch,
-        out_hw=(1024, 1024),  # Reduced size for safety
-        in_rot_deg=0
-    )
 
+DEFAULT_YAWS = [i * (360 // 8) for i in range(8)]
+DEFAULT_PITCHES = [-30, 0, 30]
+
+@functools.lru_cache(maxsize=4)
+def ray_grid(fov, out_hw):
+    """Camera ray for every output pixel of a view looking down +z; only depends on fov and size"""
+    half = np.tan(np.deg2rad(fov) / 2)
+    xs = np.linspace(-half, half, num=out_hw[1], dtype=np.float32)
+    ys = np.linspace(-half, half, num=out_hw[0], dtype=np.float32)
+    rays = np.ones((*out_hw, 3), np.float32)
+    rays[..., :2] = np.stack(np.meshgrid(xs, -ys), -1)
+    return rays
+
+def view_rotation(yaw, pitch):
+    """Row-vector rotation that points the +z ray at (yaw, pitch), matching py360convert.e2p"""
+    u, v = -np.deg2rad(yaw), np.deg2rad(pitch)
+    rx = np.array([[1, 0, 0], [0, np.cos(v), -np.sin(v)], [0, np.sin(v), np.cos(v)]])
+    ry = np.array([[np.cos(u), 0, np.sin(u)], [0, 1, 0], [-np.sin(u), 0, np.cos(u)]])
+    return (rx @ ry).astype(np.float32)
+
+def perspective_maps(in_hw, out_hw, fov, yaw, pitch):
+    """Equirectangular sample coordinates (map_x, map_y) for one view"""
+    xyz = ray_grid(fov, out_hw) @ view_rotation(yaw, pitch)
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    lon = np.arctan2(x, z)
+    lat = np.arctan2(y, np.hypot(x, z))
+    map_x = (lon / (2 * np.pi) + 0.5) * in_hw[1] - 0.5
+    map_y = (-lat / np.pi + 0.5) * in_hw[0] - 0.5
+    return map_x.astype(np.float32), map_y.astype(np.float32)
+
+# The maps only depend on sizes and angles, never on pixels, so every panorama of the
+# same size reuses them. Sized to one default sweep (~6 MB a view at 1024x1024), since
+# the Streamlit app keeps this cache alive for the life of its process.
+@functools.lru_cache(maxsize=len(DEFAULT_YAWS) * len(DEFAULT_PITCHES))
+def view_maps(in_h, in_w, out_h, out_w, fov, yaw, pitch):
+    """Fixed-point cv2.remap maps for one view"""
+    map_x, map_y = perspective_maps((in_h, in_w), (out_h, out_w), fov, yaw, pitch)
+    # Fixed-point maps take half the memory of float32 and hit OpenCV's integer remap path
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+def useful_width(fov, out_hw):
+    """Widest equirectangular input whose pixels a view can still tell apart"""
+    half = np.tan(np.deg2rad(fov) / 2)
+    # Rays are densest at the view's edges, where one output pixel spans
+    # pixel_pitch / (1 + half^2) radians
+    pixel_pitch = 2 * half / max(out_hw)
+    return int(np.ceil(2 * np.pi * (1 + half ** 2) / pixel_pitch))
+
+def render_view(e_img, fov, out_hw, pitch, yaw):
+    map1, map2 = view_maps(*e_img.shape[:2], *out_hw, fov, yaw, pitch)
+    # Wrap horizontally so views straddling the 180° seam sample across it
+    return cv2.remap(e_img, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+
+# Views per grid_sample call; bounds GPU memory to a few hundred MB at 1024x1024
+GPU_BATCH = 8
+
+# Like view_maps, the grids only depend on sizes and angles; one default sweep's worth
+# stays on the GPU (~8 MB each at 1024x1024)
+@functools.lru_cache(maxsize=len(DEFAULT_YAWS) * len(DEFAULT_PITCHES))
+def view_grid(in_h, in_w, out_h, out_w, fov, yaw, pitch):
+    """grid_sample grid for one view, as a CUDA tensor"""
+    import torch
+
+    map_x, map_y = perspective_maps((in_h, in_w), (out_h, out_w), fov, yaw, pitch)
+    # grid_sample wants pixel-centre coordinates normalised to [-1, 1]
+    grid = np.stack([(map_x + 0.5) / in_w * 2 - 1, (map_y + 0.5) / in_h * 2 - 1], -1)
+    return torch.from_numpy(grid).cuda()
+
+def render_views_gpu(e_img, fov, out_hw, tasks):
+    """Yield (pitch, yaw, image) for each task, sampling batches of views with torch on CUDA"""
+    import torch
+    import torch.nn.functional as F
+
+    if not torch.cuda.is_available():
+        raise RuntimeError("CUDA is not available")
+
+    in_h, in_w = e_img.shape[:2]
+    src = torch.from_numpy(np.ascontiguousarray(e_img)).cuda().permute(2, 0, 1).unsqueeze(0).float()
+
+    for start in range(0, len(tasks), GPU_BATCH):
+        batch = tasks[start:start + GPU_BATCH]
+        grid = torch.stack([view_grid(in_h, in_w, *out_hw, fov, yaw, pitch) for pitch, yaw in batch])
+        out = F.grid_sample(src.expand(len(batch), -1, -1, -1), grid, mode='bilinear', padding_mode='border', align_corners=False)
+        out = out.round().clamp(0, 255).byte().permute(0, 2, 3, 1).cpu().numpy()
+        for (pitch, yaw), perspective_img in zip(batch, out):
+            yield pitch, yaw, perspective_img
+
+# Pillow's default, which the views have always been saved at
+JPEG_QUALITY = 75
+
+def save_view(perspective_img, file_name, out_dir, pitch, yaw):
+    """Write one BGR view as <file_name>_split_<yaw>_<pitch>.jpg; returns the path"""
     out_file_name = os.path.join(out_dir, f"{file_name}_split_{yaw}_{pitch}.jpg") 
-    print(f"Saving file: {out_file_name}")
-    
-    img = Image.fromarray(perspective_img)
-    img.save(out_file_name)
+    # OpenCV's libjpeg-turbo encoder, without the PIL.Image wrapper. imencode + tofile
+    # rather than imwrite, which can't open non-ASCII paths on Windows.
+    ok, jpeg = cv2.imencode(".jpg", perspective_img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise RuntimeError(f"Could not encode {out_file_name}")
+    jpeg.tofile(out_file_name)
+    return out_file_name
+
+def generate_and_save(e_img, file_name, out_dir, fov, out_hw, pitch, yaw):
+    return save_view(render_view(e_img, fov, out_hw, pitch, yaw), file_name, out_dir, pitch, yaw)
+
+def pano_to_perspective(input_path, output_dir=None, fov=100, out_hw=(1024, 1024),
+                        yaw_vals=DEFAULT_YAWS, pitch_vals=DEFAULT_PITCHES, workers=None,
+                        use_gpu=False, log=print, image_bytes=None):
+    """
+    Split an equirectangular panorama into perspective views under <output_dir>/perspectives
 
-def pano_to_perspective(input_path, output_dir=None, fov=100, yaw=0, pitch=0):
-    input_path = os.path.abspath(input_path)
-    print(f"Input path: {input_path}")
+    Args:
+        input_path: Path to input panorama
+        output_dir: Base output directory (defaults to data/output)
+        fov: Field of view for perspective views
+        out_hw: (height, width) of each view
+        yaw_vals, pitch_vals: Angles to render; every pitch is paired with every yaw
+        workers: Threads rendering views (defaults to the CPU count)
+        use_gpu: Try batched CUDA rendering before falling back to the CPU
+        log: Called with each progress message, always from the calling thread
+        image_bytes: Encoded image to split instead of reading input_path, which then
+            only names the views
+
+    Returns:
+        list of saved view paths, or None if the panorama couldn't be loaded
+    """
+    if image_bytes is None:
+        input_path = os.path.abspath(input_path)
+    log(f"Input path: {input_path}")
     
-    if not os.path.exists(input_path):
-        print(f"ERROR: File not found: {input_path}")
-        return False
+    if image_bytes is None and not os.path.exists(input_path):
+        log(f"ERROR: File not found: {input_path}")
+        return None
     
     file_name = os.path.basename(input_path).split('.')[0]
-    print(f"File name: {file_name}")
+    log(f"File name: {file_name}")
 
-    if len(sys.argv) > 2:
-        base_output_dir = sys.argv[2]
-        out_dir = os.path.join(base_output_dir, "perspectives")
-    else:
-        out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "output", "perspectives")
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "output")
+    out_dir = os.path.join(output_dir, "perspectives")
 
-    print(f"Output directory: {out_dir}")
+    log(f"Output directory: {out_dir}")
     os.makedirs(out_dir, exist_ok=True)
     
-    # Load the image
+    # Load the image. Kept in OpenCV's BGR order end to end: the remap doesn't care which
+    # channel is which, and the JPEG encoder wants BGR, so no channel flip is ever made.
     try:
-        e_img = cv2.imread(input_path)[:, :, ::-1]
-        print(f"Loaded image shape: {e_img.shape}")
+        if image_bytes is None:
+            e_img = cv2.imread(input_path, cv2.IMREAD_COLOR)
+        else:
+            e_img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if e_img is None:
+            raise ValueError("not a readable image")
+        log(f"Loaded image shape: {e_img.shape}")
     except Exception as e:
-        print(f"ERROR loading image: {e}")
-        return False
-    num_pics = 8 
-    success_count = 0
-    # Safer: fewer perspectives, processed sequentially
-    yaw_vals = [i*(360//num_pics) for i in range(num_pics)]  # 4 cardinal directions
-    pitch_vals = [-30, 0, 30]
-    expected = len(pitch_vals) * len(yaw_vals)
+        log(f"ERROR loading image: {e}")
+        return None
+
+    out_hw = tuple(out_hw)
+    # cv2.remap only interpolates between neighbouring pixels, so detail finer than the
+    # views sample just aliases. Area-average it away once, which also shrinks the remap input.
+    max_w = useful_width(fov, out_hw)
+    if e_img.shape[1] > max_w:
+        e_img = cv2.resize(e_img, (max_w, round(e_img.shape[0] * max_w / e_img.shape[1])),
+                           interpolation=cv2.INTER_AREA)
+        log(f"Downsampled to {e_img.shape[1]}x{e_img.shape[0]} to match the view resolution")
+
     tasks = [(pitch, yaw) for pitch in pitch_vals for yaw in yaw_vals]
+    generated_files = []
     
-    print(f"Creating {len(tasks)} perspective views...")
-    
-    # Process sequentially to avoid memory issues
-    for pitch, yaw in tasks:
-        try:
-            generate_and_save(e_img, file_name, out_dir, fov, pitch, yaw)
-            success_count+=1 
-        except Exception as e:
-            print(f"ERROR processing pitch={pitch}, yaw={yaw}: {e}")
+    log(f"Creating {len(tasks)} perspective views...")
+
+    # cv2.remap and the JPEG encoder both release the GIL, so views render in parallel
+    # threads sharing the one read-only e_img
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        futures = {}
+        if use_gpu:
+            rendered = 0
+            try:
+                # GPU views still go through the threaded JPEG encode
+                for pitch, yaw, perspective_img in render_views_gpu(e_img, fov, out_hw, tasks):
+                    futures[ex.submit(save_view, perspective_img, file_name, out_dir, pitch, yaw)] = (pitch, yaw)
+                    rendered += 1
+            except (ImportError, RuntimeError) as e:
+                log(f"GPU rendering unavailable ({e}), continuing on the CPU")
+            # Views are yielded in order, so whatever is left still needs the CPU path
+            tasks = tasks[rendered:]
+
+        for pitch, yaw in tasks:
+            futures[ex.submit(generate_and_save, e_img, file_name, out_dir, fov, out_hw, pitch, yaw)] = (pitch, yaw)
+        for future in as_completed(futures):
+            pitch, yaw = futures[future]
+            try:
+                generated_files.append(future.result())
+                log(f"Saving file: {generated_files[-1]}")
+            except Exception as e:
+                log(f"ERROR processing pitch={pitch}, yaw={yaw}: {e}")
             
-    print("Perspective conversion complete!")
-    print(f"Successes: {success_count}, Expected: {expected}")
-    return True
+    log("Perspective conversion complete!")
+    log(f"Successes: {len(generated_files)}, Expected: {len(yaw_vals) * len(pitch_vals)}")
+    return generated_files
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python to_perspective_fixed.py <image_path> <output_path>")
+    parser = argparse.ArgumentParser(description="Split an equirectangular panorama into perspective views")
+    parser.add_argument("image_paths", nargs="+", metavar="image_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--fov", type=float, default=100)
+    parser.add_argument("--size", type=int, nargs=2, default=[1024, 1024], metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--yaws", type=int, nargs="+", default=DEFAULT_YAWS)
+    parser.add_argument("--pitches", type=int, nargs="+", default=DEFAULT_PITCHES)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--gpu", action="store_true")
+    args = parser.parse_args()
+
+    # Several panoramas per run share one interpreter start-up, import and map cache
+    failed = 0
+    for image_path in args.image_paths:
+        generated = pano_to_perspective(
+            image_path, args.output_path, fov=args.fov, out_hw=args.size,
+            yaw_vals=args.yaws, pitch_vals=args.pitches, workers=args.workers, use_gpu=args.gpu,
+        )
+        if generated is None:
+            failed += 1
+
+    if failed:
         sys.exit(1)
-    
-    input_path = sys.argv[1]
-    output_dir = sys.argv[2] 
-    success = pano_to_perspective(input_path, output_dir)
-    
-    if not success:
-        sys.exit(1)
\ No newline at end of file
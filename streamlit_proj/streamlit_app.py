@@ -1,51 +1,113 @@
 import streamlit as st
 import os
 import sys
-import numpy as np
-import pandas as pd
-from pathlib import Path
 import tempfile
 import uuid
-import atexit
 import shutil
 import zipfile
+import io
+import hashlib
+import re
 from datetime import datetime
 import time
 import math
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import threading
+from collections import deque
 
-# Import heavy modules once at startup
+# Modules the first page needs. streetlevel (which pulls in torch and torchvision),
+# pillow_heif and OpenCV are imported where they're used, so opening the page and
+# picking a location doesn't wait on them.
 try:
-    import cv2
-    import torch
-    import torchvision
     import folium
     from streamlit_folium import st_folium
-    
-    # Import script modules
-    import pillow_heif as ph
     from PIL import Image
-    from streetlevel import lookaround
-    import py360convert
     
 except ImportError as e:
     st.error(f"Missing required dependencies: {e}")
 
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
 # Import script functions
 def import_script_functions():
     """Import functions from script files"""
     try:
-        # Add scripts directory to path
-        app_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(app_dir)
-        scripts_dir = os.path.join(project_root, "scripts")
-        sys.path.insert(0, scripts_dir)
+        # Add scripts directory to path, once per process rather than once per session
+        if SCRIPTS_DIR not in sys.path:
+            sys.path.insert(0, SCRIPTS_DIR)
         
-        return scripts_dir
+        return SCRIPTS_DIR
     except Exception as e:
         st.error(f"Failed to import script functions: {e}")
         return None
 
+# Coverage tiles requested at once by find_lookaround_panoramas
+COVERAGE_WORKERS = 8
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def find_lookaround_panoramas(lat, lon, num_panos):
+    """
+    Collect the Lookaround panoramas on the coverage tiles around a point
+    
+    Cached, so repeat downloads near the same spot skip the coverage requests.
+    
+    Returns:
+        tuple: (panos, number of tiles checked, per-tile error messages),
+        or None if there is no coverage tile at the point
+    """
+    from streetlevel import lookaround
+    
+    initial_tile = lookaround.get_coverage_tile_by_latlon(lat, lon)
+    
+    if not initial_tile:
+        return None
+    
+    initial_tile_x = initial_tile.x
+    initial_tile_y = initial_tile.y
+    
+    # Expand search area based on number of requested panoramas
+    search_radius = max(1, math.ceil(math.sqrt(num_panos / 4)))
+    
+    tile_coords_to_check = set()
+    for dx in range(-search_radius, search_radius + 1):
+        for dy in range(-search_radius, search_radius + 1):
+            tile_coords_to_check.add((initial_tile_x + dx, initial_tile_y + dy))
+    
+    def fetch_tile(tile_coords):
+        """Panoramas on one tile; returns (panos, error message or None)"""
+        tile_x, tile_y = tile_coords
+        try:
+            tile = lookaround.get_coverage_tile(tile_x, tile_y)
+            return (tile.panos if tile and tile.panos else []), None
+        except Exception as e:
+            return [], f"Could not fetch tile ({tile_x}, {tile_y}): {e}"
+    
+    all_panos = []
+    tile_errors = []
+    # Each tile is an independent round-trip, so fetch a batch of them at once
+    with ThreadPoolExecutor(max_workers=min(COVERAGE_WORKERS, len(tile_coords_to_check))) as ex:
+        for panos, error in ex.map(fetch_tile, tile_coords_to_check):
+            all_panos.extend(panos)
+            if error:
+                tile_errors.append(error)
+    
+    return all_panos, len(tile_coords_to_check), tile_errors
+
+# Panoramas downloaded at once by get_lookaround_panoramas
+PANO_WORKERS = 4
+
+# Cube faces per Lookaround panorama, all requested at once
+PANO_FACES = 6
+
+# Panoramas split at once by split_panoramas_to_perspective
+SPLIT_WORKERS = 2
+
+# Display width of each preview in the perspective grid
+PREVIEW_WIDTH = 300
+
+# Bounding box of the downloaded panorama previews; large enough for a full-width single preview
+PANORAMA_PREVIEW_SIZE = (1600, 1600)
+
 def get_lookaround_panoramas(target_lat, target_lon, out_dir, num_panos, zoom, progress_callback=None):
     """
     Download panoramas from Apple Lookaround
@@ -62,6 +124,10 @@ def get_lookaround_panoramas(target_lat, target_lon, out_dir, num_panos, zoom, p
         dict: {"success": bool, "output": str, "downloaded_files": list}
     """
     try:
+        import numpy as np
+        import pillow_heif as ph
+        from streetlevel import lookaround
+        
         # Validate inputs
         if num_panos < 1 or num_panos > 500:
             return {"success": False, "output": "Number of panoramas must be between 1 and 500.", "downloaded_files": []}
@@ -74,36 +140,17 @@ def get_lookaround_panoramas(target_lat, target_lon, out_dir, num_panos, zoom, p
         # Initialize authentication
         auth = lookaround.Authenticator()
         
-        # Get initial coverage tile
-        initial_tile = lookaround.get_coverage_tile_by_latlon(target_lat, target_lon)
+        # Rounded to ~11 m so nudging the marker reuses the cached coverage search
+        search = find_lookaround_panoramas(round(target_lat, 4), round(target_lon, 4), num_panos)
         
-        if not initial_tile:
+        if search is None:
             return {"success": False, "output": f"No coverage tile found for coordinates {target_lat}, {target_lon}.", "downloaded_files": []}
         
-        initial_tile_x = initial_tile.x
-        initial_tile_y = initial_tile.y
-        
-        # Expand search area based on number of requested panoramas
-        search_radius = max(1, math.ceil(math.sqrt(num_panos / 4)))
-        
-        tile_coords_to_check = set()
-        for dx in range(-search_radius, search_radius + 1):
-            for dy in range(-search_radius, search_radius + 1):
-                tile_coords_to_check.add((initial_tile_x + dx, initial_tile_y + dy))
-        
-        all_panos = []
+        all_panos, tile_count, tile_errors = search
         if progress_callback:
-            progress_callback(f"Fetching panoramas from {len(tile_coords_to_check)} coverage tiles...")
-        
-        for tile_x, tile_y in tile_coords_to_check:
-            try:
-                tile = lookaround.get_coverage_tile(tile_x, tile_y)
-                if tile and tile.panos:
-                    all_panos.extend(tile.panos)
-            except Exception as e:
-                if progress_callback:
-                    progress_callback(f"Could not fetch tile ({tile_x}, {tile_y}): {e}")
-                continue
+            progress_callback(f"Fetched panoramas from {tile_count} coverage tiles")
+            for message in tile_errors:
+                progress_callback(message)
         
         if not all_panos:
             return {"success": False, "output": "No panoramas found in the selected coverage tiles.", "downloaded_files": []}
@@ -115,9 +162,16 @@ def get_lookaround_panoramas(target_lat, target_lon, out_dir, num_panos, zoom, p
             """Calculate simple Euclidean distance between two coordinates"""
             return math.sqrt(((lat1 - lat2) ** 2) + ((lon1 - lon2) ** 2))
         
-        # Sort panoramas by distance and take the closest ones
-        sorted_panos = sorted(all_panos, key=lambda p: distance(p.lat, p.lon, target_lat, target_lon))
-        selected_panos = sorted_panos[:num_panos]
+        # Take the closest panoramas without sorting the whole list, exactly as
+        # get_lookaround.py does so both front ends pick the same ones in the same order.
+        # Squared distance orders the same as distance, so the sqrt is skipped here.
+        lats = np.fromiter((p.lat for p in all_panos), dtype=np.float64, count=len(all_panos))
+        lons = np.fromiter((p.lon for p in all_panos), dtype=np.float64, count=len(all_panos))
+        dist_sq = (lats - target_lat) ** 2 + (lons - target_lon) ** 2
+        k = min(num_panos, len(all_panos))
+        closest = np.argpartition(dist_sq, k - 1)[:k]
+        closest = closest[np.argsort(dist_sq[closest])]
+        selected_panos = [all_panos[i] for i in closest]
         
         if progress_callback:
             progress_callback(f"Selected {len(selected_panos)} closest panorama(s)")
@@ -125,47 +179,70 @@ def get_lookaround_panoramas(target_lat, target_lon, out_dir, num_panos, zoom, p
                 dist = distance(pano.lat, pano.lon, target_lat, target_lon)
                 progress_callback(f"  {i}. Pano {pano.id} at {pano.lat}, {pano.lon} (distance: {dist:.8f}) - {pano.date}")
         
-        # Process each selected panorama
-        successful_downloads = 0
-        failed_downloads = 0
-        downloaded_files = []
-        
-        for pano_idx, pano in enumerate(selected_panos, 1):
-            if progress_callback:
-                progress_callback(f"Processing panorama {pano_idx}/{len(selected_panos)}: {pano.id}")
-            
+        # Process the selected panoramas concurrently. Downloads are network-bound and the
+        # reprojection runs in torch, which releases the GIL, so threads are enough here.
+        # Workers collect their messages and the calling thread reports them, since the
+        # progress callback writes to Streamlit and must stay on the script thread.
+        # Face requests are plain round-trips, so a panorama's faces are fetched side by side
+        # from one pool shared by every panorama in flight. A separate pool from the
+        # panorama workers, so those can block on their faces without starving them.
+        face_ex = ThreadPoolExecutor(max_workers=PANO_WORKERS * PANO_FACES)
+
+        def process_pano(pano):
+            """Download, reproject and save one panorama; returns (saved path or None, messages)"""
+            messages = []
             faces = []
-            face_download_success = True
+            face_futures = [
+                face_ex.submit(lookaround.get_panorama_face, pano, face_idx, zoom, auth)
+                for face_idx in range(PANO_FACES)
+            ]
             
-            for face_idx in range(6):
+            # Decode in face order as each arrives, overlapping the remaining downloads
+            for face_idx, face_future in enumerate(face_futures):
                 try:
-                    face_heic = lookaround.get_panorama_face(pano, face_idx, zoom, auth)
+                    face_heic = face_future.result()
+                    # Each call decodes in its own libheif context with the GIL released,
+                    # so the panorama workers decode their faces in parallel. to_pillow builds
+                    # the image straight from the decoded buffer, honouring its row stride.
                     face = ph.open_heif(face_heic, convert_hdr_to_8bit=False, bgr_mode=False)
-                    np_arr = np.asarray(face)
-                    faces.append(Image.fromarray(np_arr))
+                    faces.append(face.to_pillow())
                 except Exception as e:
-                    if progress_callback:
-                        progress_callback(f"Error downloading face {face_idx} for pano {pano.id}: {e}")
-                    face_download_success = False
-                    break
+                    for pending in face_futures:
+                        pending.cancel()
+                    messages.append(f"Error downloading face {face_idx} for pano {pano.id}: {e}")
+                    messages.append(f"Could not download all {PANO_FACES} faces for pano {pano.id}. Skipping.")
+                    return None, messages
             
-            if face_download_success and len(faces) == 6:
-                try:
-                    result = lookaround.to_equirectangular(faces, pano.camera_metadata)
-                    output_filename = os.path.join(out_dir, f"{pano.id}_{zoom}.jpg")
-                    result.save(output_filename, options={"quality": 100})
+            try:
+                result = lookaround.to_equirectangular(faces, pano.camera_metadata)
+                output_filename = os.path.join(out_dir, f"{pano.id}_{zoom}.jpg")
+                result.save(output_filename, quality=95, subsampling=2, optimize=False, progressive=False)
+                messages.append(f"Saved equirectangular panorama: {output_filename}")
+                return output_filename, messages
+            except Exception as e:
+                messages.append(f"Error creating equirectangular panorama for pano {pano.id}: {e}")
+                return None, messages
+        
+        successful_downloads = 0
+        failed_downloads = 0
+        downloaded_files = []
+        
+        if progress_callback:
+            progress_callback(f"Processing {len(selected_panos)} panorama(s), {min(PANO_WORKERS, len(selected_panos))} at a time")
+        
+        with face_ex, ThreadPoolExecutor(max_workers=min(PANO_WORKERS, len(selected_panos))) as ex:
+            futures = [ex.submit(process_pano, pano) for pano in selected_panos]
+            for done_idx, future in enumerate(as_completed(futures), 1):
+                output_filename, messages = future.result()
+                if progress_callback:
+                    for message in messages:
+                        progress_callback(message)
+                    progress_callback(f"Finished {done_idx}/{len(selected_panos)}")
+                if output_filename:
                     downloaded_files.append(output_filename)
-                    if progress_callback:
-                        progress_callback(f"Saved equirectangular panorama: {output_filename}")
                     successful_downloads += 1
-                except Exception as e:
-                    if progress_callback:
-                        progress_callback(f"Error creating equirectangular panorama for pano {pano.id}: {e}")
+                else:
                     failed_downloads += 1
-            else:
-                if progress_callback:
-                    progress_callback(f"Could not download all 6 faces for pano {pano.id}. Skipping.")
-                failed_downloads += 1
         
         # Summary
         output_lines = [
@@ -185,7 +262,7 @@ def get_lookaround_panoramas(target_lat, target_lon, out_dir, num_panos, zoom, p
     except Exception as e:
         return {"success": False, "output": f"Error in get_lookaround_panoramas: {str(e)}", "downloaded_files": []}
 
-def convert_panorama_to_perspective(input_path, output_dir, fov=100, progress_callback=None):
+def convert_panorama_to_perspective(input_path, output_dir, fov=100, progress_callback=None, image_bytes=None):
     """
     Convert equirectangular panorama to perspective views
     
@@ -194,69 +271,30 @@ def convert_panorama_to_perspective(input_path, output_dir, fov=100, progress_ca
         output_dir: Output directory for perspective views
         fov: Field of view for perspective views
         progress_callback: Function to call with progress updates
+        image_bytes: Encoded panorama to split instead of reading input_path
     
     Returns:
         dict: {"success": bool, "output": str, "generated_files": list}
     """
     try:
-        input_path = os.path.abspath(input_path)
-        
-        if not os.path.exists(input_path):
-            return {"success": False, "output": f"File not found: {input_path}", "generated_files": []}
-        
-        file_name = os.path.basename(input_path).split('.')[0]
-        perspective_dir = os.path.join(output_dir, "perspectives")
-        os.makedirs(perspective_dir, exist_ok=True)
-        
-        if progress_callback:
-            progress_callback(f"Loading image: {input_path}")
-        
-        # Load the image
-        e_img = cv2.imread(input_path)[:, :, ::-1]
-        
-        if progress_callback:
-            progress_callback(f"Loaded image shape: {e_img.shape}")
-        
-        # Generate perspective views
-        num_pics = 8 
-        yaw_vals = [i*(360//num_pics) for i in range(num_pics)]
-        pitch_vals = [-30, 0, 30]
-        
-        tasks = [(pitch, yaw) for pitch in pitch_vals for yaw in yaw_vals]
-        generated_files = []
-        success_count = 0
-        
-        if progress_callback:
-            progress_callback(f"Creating {len(tasks)} perspective views...")
+        # Shared with scripts/to_perspective.py (on sys.path via import_script_functions)
+        from to_perspective import pano_to_perspective, DEFAULT_YAWS, DEFAULT_PITCHES
+
+        generated_files = pano_to_perspective(
+            input_path,
+            output_dir,
+            fov=fov,
+            log=progress_callback or (lambda message: None),
+            image_bytes=image_bytes,
+        )
         
-        for i, (pitch, yaw) in enumerate(tasks):
-            try:
-                if progress_callback:
-                    progress_callback(f"Creating perspective view {i+1}/{len(tasks)}: pitch={pitch}, yaw={yaw}")
-                
-                perspective_img = py360convert.e2p(
-                    e_img,
-                    fov_deg=(fov, fov),
-                    u_deg=yaw,
-                    v_deg=pitch,
-                    out_hw=(1024, 1024),
-                    in_rot_deg=0
-                )
-                
-                out_file_name = os.path.join(perspective_dir, f"{file_name}_split_{yaw}_{pitch}.jpg")
-                img = Image.fromarray(perspective_img)
-                img.save(out_file_name)
-                generated_files.append(out_file_name)
-                success_count += 1
-                
-            except Exception as e:
-                if progress_callback:
-                    progress_callback(f"Error processing pitch={pitch}, yaw={yaw}: {e}")
+        if generated_files is None:
+            return {"success": False, "output": f"Could not load panorama: {input_path}", "generated_files": []}
         
-        output_summary = f"Perspective conversion complete! Successes: {success_count}, Expected: {len(tasks)}"
+        output_summary = f"Perspective conversion complete! Successes: {len(generated_files)}, Expected: {len(DEFAULT_YAWS) * len(DEFAULT_PITCHES)}"
         
         return {
-            "success": success_count > 0, 
+            "success": len(generated_files) > 0, 
             "output": output_summary, 
             "generated_files": generated_files
         }
@@ -278,17 +316,16 @@ def run_function_with_progress(func, title="Processing", **kwargs):
     """
     st.info(f" {title}...")
     output_placeholder = st.empty()
-    progress_lines = []
+    # Only the tail is ever shown, so older lines are dropped as new ones arrive
+    progress_lines = deque(maxlen=10)
     
     def progress_callback(message):
         progress_lines.append(str(message))
-        recent_output = '\n'.join(progress_lines[-10:])
-        output_placeholder.text_area(
-            f" {title}:", 
-            recent_output, 
-            height=150,
-            disabled=True
-        )
+        recent_output = '\n'.join(progress_lines)
+        # A plain code block rather than a disabled text_area: no widget state to register
+        # per line. Streamlit already merges back-to-back updates to the same placeholder
+        # into one delta before it is sent, so a burst of lines costs one repaint.
+        output_placeholder.code(recent_output, language=None)
     
     try:
         # Add progress callback to function arguments
@@ -305,6 +342,9 @@ def run_function_with_progress(func, title="Processing", **kwargs):
         st.error(f" Error: {str(e)}")
         return {"success": False, "output": str(e)}
 
+# Already entropy-coded; deflating them again costs CPU for well under 1% in size
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic')
+
 def create_output_zip():
     """Creates a zip file of the current output directory"""
     if not (os.path.exists(st.session_state.output_dir)):
@@ -322,45 +362,143 @@ def create_output_zip():
     zip_filename = f"panorama_session_{st.session_state.session_id}_{timestamp}.zip"
     zip_path = os.path.join(st.session_state.temp_dir, zip_filename)
     
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
         for file_path in all_files:
             arcname = os.path.relpath(file_path, st.session_state.output_dir)
-            zipf.write(file_path, arcname)
+            if file_path.lower().endswith(STORED_EXTENSIONS):
+                zipf.write(file_path, arcname, compress_type=zipfile.ZIP_STORED)
+            else:
+                zipf.write(file_path, arcname)
     
     return zip_path, zip_filename
 
-def split_panoramas_to_perspective(file_list):
-    """Split panoramas into perspective views"""
+def file_digest(path, chunk_size=1024 * 1024):
+    """sha256 hex digest of the file at path, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def view_stem(file_path):
+    """Source name to_perspective gives the views of file_path"""
+    return os.path.basename(file_path).split('.')[0]
+
+def split_panoramas_to_perspective(file_list, file_data=None):
+    """
+    Split panoramas into perspective views
     
-    total_files = len(file_list)
-    st.info(f" Processing {total_files} panorama(s) into perspective views...")
+    Args:
+        file_list: (mod_time, filename, file_path) entries to split
+        file_data: {file_path: bytes} for panoramas held in memory rather than on disk
+    """
+    file_data = file_data or {}
     
+    total_files = len(file_list)
     progress_bar = st.progress(0)
-    status_placeholder = st.empty()
     
     processed_successfully = 0
-    all_outputs = []
+    # Only the tail is shown on the page; the whole log goes to disk for download
+    all_outputs = deque(maxlen=5000)
+    failures = []
     
-    for i, (mod_time, filename, file_path) in enumerate(file_list):
-        status_placeholder.info(f" Processing {filename} ({i+1}/{total_files})")
-        
-        result = run_function_with_progress(
-            convert_panorama_to_perspective,
-            title=f"Processing {filename}",
+    # Read on the script thread; session state isn't reachable from the workers
+    output_dir = st.session_state.output_dir
+    # Kept beside the output folder so it isn't counted or zipped with the results
+    log_path = os.path.join(st.session_state.temp_dir, "script_output", "split_log.txt")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    # Source name -> (content digest, views) of its last split this session. Views are named
+    # after the source, so a name holds whichever image was split under it most recently.
+    split_manifest = st.session_state.setdefault('split_manifest', {})
+    # Stem -> token of the conversion that most recently started writing its views
+    last_writer = {}
+    
+    def convert(file_path):
+        """Convert one panorama off the script thread; returns (result, log lines)"""
+        data = file_data.get(file_path)
+        name = view_stem(file_path)
+        try:
+            digest = file_digest(file_path) if data is None else hashlib.sha256(data).hexdigest()
+        except OSError:
+            digest = None
+        
+        # Splitting the same image again would only rewrite identical views
+        last_digest, views = split_manifest.get(name, (None, None))
+        if digest is not None and digest == last_digest and all(os.path.exists(view) for view in views):
+            return {
+                "success": True,
+                "output": f"{os.path.basename(file_path)} is unchanged since it was last split; reusing its {len(views)} views",
+                "generated_files": views
+            }, []
+        
+        # The views about to be written replace whatever the entry pointed at
+        split_manifest.pop(name, None)
+        token = last_writer[name] = object()
+        messages = []
+        result = convert_panorama_to_perspective(
             input_path=file_path,
-            output_dir=st.session_state.output_dir
+            output_dir=output_dir,
+            progress_callback=messages.append,
+            image_bytes=data
         )
+        # Only the last conversion to write a stem's views may vouch for them
+        if result["success"] and digest is not None and last_writer.get(name) is token:
+            split_manifest[name] = (digest, result["generated_files"])
+        return result, messages
+    
+    # Sources sharing a stem (a.jpg and a.png, site.north.jpg and site.south.jpg) write the
+    # same view files, so each stem's sources are queued and run one after another
+    by_stem = {}
+    for mod_time, filename, file_path in file_list:
+        by_stem.setdefault(view_stem(file_path), deque()).append((filename, file_path))
+    split_workers = min(SPLIT_WORKERS, len(by_stem))
+    
+    # Overlap panoramas so one's decode and save overlap another's rendering. Each
+    # conversion already renders its views on a thread pool, so a couple at once is enough.
+    # One status container collects a line per finished panorama instead of repainting a placeholder
+    with st.status(f" Processing {total_files} panorama(s) into perspective views, {split_workers} at a time...", expanded=True) as status, \
+            open(log_path, "w", encoding="utf-8") as log_file:
+        with ThreadPoolExecutor(max_workers=split_workers) as ex:
+            futures = {}
+            
+            def submit_next(stem):
+                """Start the next queued source with this stem, if any"""
+                if by_stem[stem]:
+                    filename, file_path = by_stem[stem].popleft()
+                    futures[ex.submit(convert, file_path)] = (filename, stem)
+            
+            for stem in by_stem:
+                submit_next(stem)
+            
+            finished = 0
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished += 1
+                    filename, stem = futures.pop(future)
+                    submit_next(stem)
+                    result, messages = future.result()
+                    
+                    output_lines = [f"--- {filename} ---", *messages, result["output"]]
+                    log_file.write('\n'.join(output_lines) + '\n')
+                    all_outputs.extend(output_lines)
+                    
+                    if result["success"]:
+                        processed_successfully += 1
+                        st.write(f"Completed {filename}")
+                    else:
+                        st.write(f"Failed to process {filename}")
+                        failures.append((filename, '\n'.join(messages + [result["output"]])))
+                    
+                    progress_bar.progress(finished / total_files)
+                    status.update(label=f" Processed {finished}/{total_files} panorama(s)")
         
-        if result["success"]:
-            processed_successfully += 1
-            status_placeholder.success(f"Completed {filename}")
-            all_outputs.append(result["output"])
-        else:
-            status_placeholder.error(f"Failed to process {filename}")
-            with st.expander(f"Error details for {filename}"):
-                st.text(result["output"])
-        
-        progress_bar.progress((i + 1) / total_files)
+        status.update(state="complete" if processed_successfully == total_files else "error", expanded=False)
+    
+    # Expanders can't nest inside the status container, so error details follow it
+    for filename, details in failures:
+        with st.expander(f"Error details for {filename}"):
+            st.text(details)
     
     # Final status and show results
     if processed_successfully == total_files:
@@ -374,7 +512,73 @@ def split_panoramas_to_perspective(file_list):
     
     if all_outputs:
         with st.expander("Complete Processing Log"):
+            if len(all_outputs) == all_outputs.maxlen:
+                st.caption(f"Showing the last {all_outputs.maxlen} lines")
             st.text('\n'.join(all_outputs))
+            with open(log_path, "rb") as f:
+                st.download_button("Download full log", data=f.read(), file_name="split_log.txt", mime="text/plain")
+
+@st.cache_data(ttl=30, max_entries=32, show_spinner=False)
+def count_files(root, dir_mtimes_ns):
+    """Number of files anywhere under root; dir_mtimes_ns is only part of the cache key"""
+    return sum(len(files) for _, _, files in os.walk(root))
+
+def output_file_count(output_dir):
+    """
+    Number of files in the session output, recounted only when it changes
+    
+    Panoramas land directly in output_dir and views in its perspectives folder, so
+    those two directory mtimes change whenever a file is added or removed.
+    """
+    if not os.path.isdir(output_dir):
+        return 0
+    
+    perspective_dir = os.path.join(output_dir, "perspectives")
+    dir_mtimes_ns = (
+        os.stat(output_dir).st_mtime_ns,
+        os.stat(perspective_dir).st_mtime_ns if os.path.isdir(perspective_dir) else None
+    )
+    return count_files(output_dir, dir_mtimes_ns)
+
+# <source>_split_<yaw>_<pitch>.jpg, as written by to_perspective.save_view
+PERSPECTIVE_NAME = re.compile(r'^(.+)_split_(-?\d+(?:\.\d+)?)_(-?\d+(?:\.\d+)?)\.jpg$')
+
+@st.cache_data(ttl=30, max_entries=32, show_spinner=False)
+def scan_perspectives(perspective_dir, dir_mtime_ns):
+    """
+    Perspective views in perspective_dir grouped by source panorama
+    
+    Returns {source name: [(file name, caption), ...]} with each group ordered by yaw, then pitch.
+    dir_mtime_ns is only part of the cache key: adding or removing views bumps the
+    directory's mtime, so a fresh listing is taken exactly when it has changed.
+    """
+    grouped = {}
+    with os.scandir(perspective_dir) as entries:
+        for entry in entries:
+            match = PERSPECTIVE_NAME.match(entry.name)
+            if match and entry.is_file():
+                source, yaw, pitch = match.groups()
+                grouped.setdefault(source, []).append((float(yaw), float(pitch), entry.name, f"Yaw: {yaw}°, Pitch: {pitch}°"))
+    
+    return {source: [(name, caption) for _, _, name, caption in sorted(views)] for source, views in grouped.items()}
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def thumbnail(path, mtime_ns, size=(512, 512)):
+    """
+    JPEG bytes of a downscaled preview of the image at path
+    
+    The grids only need previews, so this keeps full-size images off the websocket.
+    mtime_ns is only part of the cache key, so a rewritten file gets a fresh preview.
+    """
+    with Image.open(path) as img:
+        # Lets the JPEG decoder scale down while decoding instead of after. draft() keeps
+        # both sides at least as large as asked, so ask for the aspect-fitted size.
+        scale = min(size[0] / img.width, size[1] / img.height)
+        img.draft('RGB', (int(img.width * scale), int(img.height * scale)))
+        img.thumbnail(size)
+        buffer = io.BytesIO()
+        img.convert('RGB').save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
 
 def show_perspective_results(recent_files, output_dir):
     """Display the generated perspective views"""
@@ -383,36 +587,31 @@ def show_perspective_results(recent_files, output_dir):
     st.subheader("️ Generated Perspective Views")
     
     base_output_dir = output_dir
+    perspective_dir = os.path.join(base_output_dir, "perspectives")
+    os.makedirs(perspective_dir, exist_ok=True)
+    
+    perspective_views = scan_perspectives(perspective_dir, os.stat(perspective_dir).st_mtime_ns)
     
     for mod_time, file, file_path in recent_files:
-        file_name = os.path.splitext(file)[0]
-        perspective_dir = os.path.join(base_output_dir, "perspectives")
-        os.makedirs(perspective_dir, exist_ok=True)
+        # Same source name to_perspective gives its views
+        file_name = file.split('.')[0]
         
         if os.path.exists(perspective_dir):
-            perspective_files = [f for f in os.listdir(perspective_dir) if f.endswith('.jpg') and '_split_' in f]
+            perspective_files = perspective_views.get(file_name, [])
             
             if perspective_files:
                 st.write(f" **{file}** → {len(perspective_files)} perspective views")
                 
                 with st.expander(f"View perspectives from {file} ({len(perspective_files)} images)"):
-                    perspective_files.sort()
+                    images = []
+                    captions = []
+                    for perspective_file, caption in perspective_files[:9]:
+                        perspective_path = os.path.join(perspective_dir, perspective_file)
+                        images.append(thumbnail(perspective_path, os.stat(perspective_path).st_mtime_ns))
+                        captions.append(caption)
                     
-                    for i in range(0, min(9, len(perspective_files)), 3):
-                        cols = st.columns(3)
-                        for j, col in enumerate(cols):
-                            if i + j < len(perspective_files):
-                                perspective_file = perspective_files[i + j]
-                                perspective_path = os.path.join(perspective_dir, perspective_file)
-                                
-                                try:
-                                    parts = perspective_file.split('_split_')[1].replace('.jpg', '').split('_')
-                                    yaw, pitch = parts[0], parts[1]
-                                    caption = f"Yaw: {yaw}°, Pitch: {pitch}°"
-                                except:
-                                    caption = perspective_file
-                                
-                                col.image(perspective_path, caption=caption, use_container_width=True)
+                    # One image element for the whole grid; the previews wrap to the expander width
+                    st.image(images, caption=captions, width=PREVIEW_WIDTH)
                     
                     if len(perspective_files) > 9:
                         st.info(f" Plus {len(perspective_files) - 9} more perspective views in {perspective_dir}")
@@ -421,9 +620,83 @@ def show_perspective_results(recent_files, output_dir):
         else:
             st.warning(f"️ Output directory not found for {file}")
 
+def build_base_map(lat, lon):
+    """Folium base map centred on (lat, lon); the selection is drawn on top by selection_layer"""
+    m = folium.Map(
+        location=[lat, lon],
+        zoom_start=15,
+        tiles='CartoDB positron'
+    )
+
+    # Render the figure once here; st_folium(render=False) then reuses it on every rerun
+    m.get_root().render()
+
+    return m
+
+def selection_layer(lat, lon):
+    """Feature group with the selection marker and search radius at (lat, lon)"""
+    curr_pos = [lat, lon]
+    fg = folium.FeatureGroup(name="Selection")
+
+    folium.Marker(
+        curr_pos,
+        popup=f"{curr_pos[0]:.4f}, {curr_pos[1]:.4f}",
+        tooltip="Click map to change location",
+        icon=folium.Icon(color='red', icon='info-sign')
+    ).add_to(fg)
+
+    folium.Circle(
+        location=curr_pos,
+        radius=100,
+        fillColor='blue',
+        fillOpacity=0.05,
+        opacity=0.1,
+    ).add_to(fg)
+
+    return fg
+
+def query_coord(name, default):
+    """Coordinate from the page URL, or default if it is missing or malformed"""
+    try:
+        return float(st.query_params.get(name, default))
+    except ValueError:
+        return default
+
+def select_clicked_location():
+    """Move the selection to the clicked point before the rerun builds the map"""
+    clicked = (st.session_state.get("panorama_map") or {}).get("last_clicked")
+    if clicked is None:
+        return
+    # ~1 m grid; a re-delivered or near-identical click leaves the selection untouched
+    lat, lon = round(clicked['lat'], 5), round(clicked['lng'], 5)
+    if (lat, lon) != (st.session_state.selected_lat, st.session_state.selected_lon):
+        st.session_state.selected_lat = lat
+        st.session_state.selected_lon = lon
+        st.query_params["lat"] = f"{lat:.5f}"
+        st.query_params["lon"] = f"{lon:.5f}"
+
+@st.fragment
+def location_picker():
+    """Map for choosing the download location; a click reruns only this fragment"""
+    # One base map per session. The selection goes over it as a feature group, so moving
+    # the marker updates the existing map instead of reloading it and resetting the view.
+    if 'base_map' not in st.session_state:
+        st.session_state.base_map = build_base_map(st.session_state.selected_lat, st.session_state.selected_lon)
+    m = st.session_state.base_map
+    fg = selection_layer(st.session_state.selected_lat, st.session_state.selected_lon)
+
+    st_folium(m, key="panorama_map", height=800, width=None, render=False, returned_objects=["last_clicked"],
+              feature_group_to_add=fg, on_change=select_clicked_location)
+
+    # st_folium attaches the group to the map; detach it so the next rerun sends the same map script.
+    # This leans on streamlit_folium internals (it re-ids the group and calls add_to(m)), which is
+    # why streamlit_folium is pinned in requirements.txt.
+    m._children.pop(fg.get_name(), None)
+
 st.set_page_config(
     page_title="Panorama Tools",
     layout="wide",
+    initial_sidebar_state="collapsed",
 )
 
 def initialize_session():
@@ -446,7 +719,8 @@ def initialize_session():
         os.makedirs(st.session_state.output_dir, exist_ok=True)
         os.makedirs(os.path.join(st.session_state.temp_dir, "script_output"), exist_ok=True)
         
-        cleanup_old_sessions(base_temp)
+        # Sweeping old sessions can mean gigabytes of unlinks; don't hold up the first page for it
+        threading.Thread(target=cleanup_old_sessions, args=(base_temp,), daemon=True).start()
         st.session_state.cleanup_registered = True
 
 def cleanup_old_sessions(base_temp, max_age_hours=24):
@@ -461,7 +735,7 @@ def cleanup_old_sessions(base_temp, max_age_hours=24):
                 try:
                     dir_mtime = os.path.getmtime(item_path)
                     if dir_mtime < cutoff_time:
-                        shutil.rmtree(item_path)
+                        shutil.rmtree(item_path, ignore_errors=True)
                 except:
                     continue
     except:
@@ -473,10 +747,7 @@ def cleanup_session(session_temp_dir):
         session_temp_dir = st.session_state.temp_dir
     
     if session_temp_dir and os.path.exists(session_temp_dir):
-        try:
-            shutil.rmtree(session_temp_dir)
-        except:
-            pass
+        shutil.rmtree(session_temp_dir, ignore_errors=True)
 
 initialize_session()
 
@@ -499,40 +770,13 @@ st.markdown("---")
 # Location selection section
 st.subheader("Select Location")
 
+# A shared link (?lat=..&lon=..) opens at the same location
 if 'selected_lat' not in st.session_state:
-    st.session_state.selected_lat = 42.3644583
+    st.session_state.selected_lat = query_coord("lat", 42.3644583)
 if 'selected_lon' not in st.session_state:
-    st.session_state.selected_lon = -71.0830152
-
-curr_pos = [st.session_state.selected_lat, st.session_state.selected_lon]
-
-m = folium.Map(
-    location=curr_pos,
-    zoom_start=15,
-    tiles='CartoDB positron'
-)
+    st.session_state.selected_lon = query_coord("lon", -71.0830152)
 
-folium.Marker(
-    curr_pos,
-    popup=f"{curr_pos[0]:.4f}, {curr_pos[1]:.4f}",
-    tooltip="Click map to change location",
-    icon=folium.Icon(color='red', icon='info-sign')
-).add_to(m)
-
-folium.Circle(
-    location=curr_pos,
-    radius=100,
-    fillColor='blue',
-    fillOpacity=0.05,
-    opacity=0.1,
-).add_to(m)
-
-map_data = st_folium(m, key="panorama_map", height=800, width=None)
-
-if map_data['last_clicked'] is not None:
-    st.session_state.selected_lat = map_data['last_clicked']['lat']
-    st.session_state.selected_lon = map_data['last_clicked']['lng']
-    st.rerun()
+location_picker()
 
 st.markdown("---")
 
@@ -571,14 +815,13 @@ with col2:
             
             if downloaded_files:
                 # Create recent_files format
-                import time
-                current_time = time.time()
                 st.session_state.recent_files = []
                 
-                for file_path in downloaded_files:
+                # One stat per file serves both the timestamps and the sizes shown below
+                file_stats = {file_path: os.stat(file_path) for file_path in downloaded_files}
+                for file_path, file_stat in file_stats.items():
                     file = os.path.basename(file_path)
-                    mod_time = os.path.getmtime(file_path)
-                    st.session_state.recent_files.append((mod_time, file, file_path))
+                    st.session_state.recent_files.append((file_stat.st_mtime, file, file_path))
                 
                 st.success(f" Successfully downloaded {len(st.session_state.recent_files)} new panoramas!")
                 
@@ -586,13 +829,13 @@ with col2:
                 if len(st.session_state.recent_files) == 1:
                     mod_time, file, file_path = st.session_state.recent_files[0]
                     download_time = time.strftime('%H:%M:%S', time.localtime(mod_time))
-                    st.image(file_path, caption=f" {file} (Downloaded: {download_time})", use_container_width=True)
+                    st.image(thumbnail(file_path, file_stats[file_path].st_mtime_ns, PANORAMA_PREVIEW_SIZE), caption=f" {file} (Downloaded: {download_time})", use_container_width=True)
                     
                 elif len(st.session_state.recent_files) <= 3:
                     cols = st.columns(len(st.session_state.recent_files))
                     for i, (mod_time, file, file_path) in enumerate(st.session_state.recent_files):
                         download_time = time.strftime('%H:%M:%S', time.localtime(mod_time))
-                        cols[i].image(file_path, caption=f" #{i+1}\n{download_time}", use_container_width=True)
+                        cols[i].image(thumbnail(file_path, file_stats[file_path].st_mtime_ns, PANORAMA_PREVIEW_SIZE), caption=f" #{i+1}\n{download_time}", use_container_width=True)
                         
                 else:
                     for i in range(0, len(st.session_state.recent_files), 3):
@@ -601,12 +844,12 @@ with col2:
                             if i + j < len(st.session_state.recent_files):
                                 mod_time, file, file_path = st.session_state.recent_files[i + j]
                                 download_time = time.strftime('%H:%M:%S', time.localtime(mod_time))
-                                col.image(file_path, caption=f" #{i+j+1}\n{download_time}", use_container_width=True)
+                                col.image(thumbnail(file_path, file_stats[file_path].st_mtime_ns, PANORAMA_PREVIEW_SIZE), caption=f" #{i+j+1}\n{download_time}", use_container_width=True)
                 
                 # File details
                 with st.expander(" File Details"):
                     for mod_time, file, file_path in st.session_state.recent_files:
-                        file_size = os.path.getsize(file_path)
+                        file_size = file_stats[file_path].st_size
                         download_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mod_time))
                         st.write(f" **{file}** - {file_size:,} bytes - Downloaded: {download_time}")
                     
@@ -622,6 +865,10 @@ st.markdown("---")
 st.subheader(" Convert to Perspective Views")
 st.write("Split panoramas into multiple perspective views for 3D reconstruction")
 
+# Forget panoramas whose files are gone (cleared session, old-session sweep) so they aren't offered for splitting
+if st.session_state.recent_files:
+    st.session_state.recent_files = [entry for entry in st.session_state.recent_files if os.path.exists(entry[2])] or None
+
 if st.session_state.recent_files:
     st.write(f" Ready to process {len(st.session_state.recent_files)} panorama(s)")
     for _, file, _ in st.session_state.recent_files:
@@ -641,15 +888,10 @@ else:
     if uploaded_panos:
         st.success(f" Uploaded {len(uploaded_panos)} panorama(s)")
         
-        temp_dir = os.path.join(st.session_state.temp_dir, "uploads")
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        uploaded_file_paths = []
-        for pano in uploaded_panos:
-            temp_file_path = os.path.join(temp_dir, pano.name)
-            with open(temp_file_path, "wb") as f:
-                f.write(pano.getbuffer())
-            uploaded_file_paths.append((None, pano.name, temp_file_path))
+        # Uploads are already in memory, so they're split straight from their bytes;
+        # getbuffer() is a view of them, and the name only labels the views
+        uploaded_file_paths = [(None, pano.name, pano.name) for pano in uploaded_panos]
+        uploaded_data = {pano.name: pano.getbuffer() for pano in uploaded_panos}
         
         preview_col1, preview_col2 = st.columns([3, 1])
         with preview_col1:
@@ -659,20 +901,15 @@ else:
         
         with preview_col2:
             if st.button(" Split Uploaded Panoramas", type="secondary", use_container_width=True):
-                split_panoramas_to_perspective(uploaded_file_paths)
+                split_panoramas_to_perspective(uploaded_file_paths, uploaded_data)
 
-if (st.session_state.recent_files or 
-    (os.path.exists(st.session_state.output_dir) and 
-     os.listdir(st.session_state.output_dir))):
+total_files = output_file_count(st.session_state.output_dir)
+
+if st.session_state.recent_files or total_files > 0:
     
     st.markdown("---")
     st.subheader(" Download Results")
     
-    total_files = 0
-    if os.path.exists(st.session_state.output_dir):
-        for root, dirs, files in os.walk(st.session_state.output_dir):
-            total_files += len(files)
-    
     if total_files > 0:
         st.write(f" Your session contains {total_files} files ready for download")
         
@@ -713,5 +950,7 @@ if st.session_state.get("cleanup_registered", False):
         st.subheader('Session Management')
         if st.button('Clear Session Files', help="Delete all files from the session"):
             cleanup_session(st.session_state.temp_dir)
+            st.session_state.recent_files = None
+            st.session_state.pop('split_manifest', None)
             st.success("Session files cleared!")
             st.rerun()
\ No newline at end of file